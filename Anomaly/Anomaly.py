@@ -100,6 +100,7 @@ from utils.DataframeUtils import DataframeUtils, ScalerType
 from utils.DataframePopulator import DataframePopulator, DatasetType
 import utils.TrainingSignals as TrainingSignals
 from utils.Environment import Environment
+from utils.LastCandleCache import LastCandleCache
 
 """
 ####################################################################################
@@ -125,7 +126,7 @@ Anomaly - Anomaly Detection Classifier
 """
 
 
-class Anomaly(IStrategy):
+class Anomaly(LastCandleCache, IStrategy):
 
     plot_config = {
         'main_plot': {
@@ -194,9 +195,11 @@ class Anomaly(IStrategy):
 
     curr_pair = ""
     custom_trade_info = {}
+    exit_candle_fields = ['fisher_wr', 'exit_long']  # last candle data used by custom_exit()
 
     compressor = None
     compress_data = True
+    scoring_cache = {}  # normalised (& compressed) data shared by training and the buy/sell classifiers
     scaler_type = ScalerType.Robust # scaler type used for normalisation
 
     dataframeUtils = None
@@ -426,6 +429,8 @@ class Anomaly(IStrategy):
 
         if self.dataframeUtils is None:
             self.dataframeUtils = DataframeUtils()
+            # normalisation results are only re-used in dry_run/live, where the same pairs are processed every candle
+            self.dataframeUtils.cache_norm_data = self.dp.runmode.value in ('dry_run', 'live')
 
         if self.dataframePopulator is None:
             self.dataframePopulator = DataframePopulator()
@@ -547,7 +552,7 @@ class Anomaly(IStrategy):
 
         # future_df = self.add_future_data(dataframe.copy())
         future_df = self.dataframePopulator.add_hidden_indicators(dataframe.copy())
-        future_df = self.dataframePopulator.add_future_data(future_df, self.curr_lookahead)
+        future_df = self.dataframePopulator.add_future_data(future_df, self.curr_lookahead, pair=self.curr_pair)
 
         future_df['train_buy'] = 0.0
         future_df['train_sell'] = 0.0
@@ -683,12 +688,11 @@ class Anomaly(IStrategy):
 
         rand_st = 27  # use fixed number for reproducibility
 
-        full_df_norm = self.dataframeUtils.norm_dataframe(dataframe)
+        full_df_norm = self.get_scoring_data(dataframe)
 
 
         if self.compress_data:
-            old_size = full_df_norm.shape[1]
-            full_df_norm = self.compress_dataframe(full_df_norm)
+            old_size = self.scoring_cache[self.curr_pair]['nfeatures']
             print("    Compressed data {} -> {} (features)".format(old_size, full_df_norm.shape[1]))
         else:
             if self.dbg_verbose:
@@ -775,7 +779,7 @@ class Anomaly(IStrategy):
         # if running 'plot', reconstruct the original dataframe for display
         if self.dp.runmode.value in ('plot'):
             if self.compress_data:
-                df_norm = self.dataframeUtils.norm_dataframe(dataframe)  # this also resets the scaler
+                df_norm = self.dataframeUtils.norm_dataframe(dataframe, key=self.curr_pair)  # this also resets the scaler
                 df_compressed = self.compress_dataframe(df_norm)
                 df_recon_compressed = self.buy_classifier.reconstruct(df_compressed)
                 df_recon_norm = self.compressor.inverse_transform(df_recon_compressed)
@@ -784,12 +788,29 @@ class Anomaly(IStrategy):
                 dataframe['%recon'] = df_recon['close']
             else:
                 # debug: get reconstructed dataframe and save 'close' as a comparison
-                tmp = self.dataframeUtils.norm_dataframe(dataframe)  # this just resets the scaler
+                tmp = self.dataframeUtils.norm_dataframe(dataframe, key=self.curr_pair)  # this just resets the scaler
                 df_recon_norm = self.buy_classifier.reconstruct(tmp)
                 df_recon = self.dataframeUtils.denorm_dataframe(df_recon_norm)
                 dataframe['%recon'] = df_recon['close']
         return dataframe
 
+    # get the normalised (and compressed) version of the dataframe. This is shared by training and by both the buy
+    # and sell classifiers, so it is only calculated once per candle
+    def get_scoring_data(self, dataframe: DataFrame) -> DataFrame:
+        key = (len(dataframe), dataframe['date'].iloc[0], dataframe['date'].iloc[-1], self.compress_data)
+        cache = self.scoring_cache.get(self.curr_pair, None)
+        if (cache is not None) and (cache['key'] == key) and (cache['compressor'] is self.compressor):
+            return cache['data']
+
+        df_norm = self.dataframeUtils.norm_dataframe(dataframe, key=self.curr_pair)
+        nfeatures = df_norm.shape[1]
+        if self.compress_data:
+            df_norm = self.compress_dataframe(df_norm)
+
+        self.scoring_cache[self.curr_pair] = {'key': key, 'compressor': self.compressor,
+                                              'nfeatures': nfeatures, 'data': df_norm}
+        return df_norm
+
     # compress the supplied dataframe
     def compress_dataframe(self, df_norm: DataFrame) -> DataFrame:
         if not self.compressor:
@@ -809,7 +830,8 @@ class Anomaly(IStrategy):
         if compressor_type == 0:
             # just use fixed size PCA (easier for classifiers to deal with)
             ncols = 64
-            compressor = skd.PCA(n_components=ncols, whiten=True, svd_solver='full').fit(df_norm)
+            compressor = self.dataframeUtils.get_pca_compressor(df_norm, n_components=ncols, whiten=True,
+                                                                key=self.curr_pair)
 
         elif compressor_type == 1:
             # accurate, but slow
@@ -854,10 +876,13 @@ class Anomaly(IStrategy):
 
         if clf:
             # print("    predicting... - dataframe:", dataframe.shape)
-            df_norm = self.dataframeUtils.norm_dataframe(dataframe)
-            if self.compress_data:
-                df_norm = self.compress_dataframe(df_norm)
-            predict = clf.predict(df_norm)
+            df_norm = self.get_scoring_data(dataframe)
+
+            # in live modes, autoencoders only need to process the new rows
+            if getattr(clf, 'stream_predictions', False) and (self.dp.runmode.value in ('dry_run', 'live')):
+                predict = clf.predict_stream(df_norm, pair, dataframe['date'].values)
+            else:
+                predict = clf.predict(df_norm)
 
         else:
             print("Null CLF for pair: ", pair)
@@ -1035,6 +1060,9 @@ class Anomaly(IStrategy):
         else:
             dataframe['exit_long'] = 0
 
+        # save the fields used by custom_exit()
+        self.update_exit_candles(dataframe, metadata['pair'])
+
         return dataframe
 
     ###################################
@@ -1069,8 +1097,7 @@ class Anomaly(IStrategy):
     def custom_exit(self, pair: str, trade: Trade, current_time: 'datetime', current_rate: float,
                     current_profit: float, **kwargs):
 
-        dataframe, _ = self.dp.get_analyzed_dataframe(pair=pair, timeframe=self.timeframe)
-        last_candle = dataframe.iloc[-1].squeeze()
+        last_candle = self.get_last_candle(pair, current_time)
         
 
         if not self.use_custom_stoploss:
@@ -32,7 +32,6 @@ import logging
 import warnings
 # import random
 
-import sklearn.decomposition as skd
 
 #import keras
 # import tensorflow as tf
@@ -48,6 +47,7 @@ from tqdm import tqdm
 from utils.DataframePopulator import DataframePopulator, DatasetType
 from utils.DataframeUtils import DataframeUtils, ScalerType
 from utils.Environment import Environment
+from utils.LastCandleCache import LastCandleCache
 
 # set paths so that we can find imports in parallel directories
 group_dir = str(Path(__file__).parent)
@@ -90,7 +90,7 @@ NNPredict - uses a Long-Short Term Memory neural network to try and predict the
 """
 
 
-class NNPredict(IStrategy):
+class NNPredict(LastCandleCache, IStrategy):
     plot_config = {
         'main_plot': {
             'close': {'color': 'cornflowerblue'},
@@ -158,6 +158,8 @@ class NNPredict(IStrategy):
 
     curr_pair = ""
     custom_trade_info = {}
+    # last candle data used by custom_exit()
+    exit_candle_fields = ["volume", "guard_metric", "predicted_gain", "target_loss", "exit_long", "curr_target"]
 
     num_pairs = 0
     # pair_model_info = {}  # holds model-related info for each pair
@@ -320,6 +322,8 @@ class NNPredict(IStrategy):
 
         if self.dataframeUtils is None:
             self.dataframeUtils = DataframeUtils()
+            # normalisation results are only re-used in dry_run/live, where the same pairs are processed every candle
+            self.dataframeUtils.cache_norm_data = self.dp.runmode.value in ('dry_run', 'live')
 
         if self.dataframePopulator is None:
 
@@ -578,7 +582,7 @@ class NNPredict(IStrategy):
 
         # scale the dataframe
         if self.curr_classifier.prescale_data():
-            df_norm = self.dataframeUtils.norm_dataframe(dataframe)
+            df_norm = self.dataframeUtils.norm_dataframe(dataframe, key=self.curr_pair)
         else:
             df_norm = dataframe.copy()
 
@@ -742,7 +746,7 @@ class NNPredict(IStrategy):
         # pre-scale if needed
         if prescale_data:
             # tgt_scaler.fit(dataframe[self.target_column].to_numpy().reshape(1, -1))
-            df_norm = self.dataframeUtils.norm_dataframe(dataframe)
+            df_norm = self.dataframeUtils.norm_dataframe(dataframe, key=self.curr_pair)
         else:
             df_norm = dataframe
 
@@ -806,7 +810,7 @@ class NNPredict(IStrategy):
 
         # pre-scale if needed
         if prescale_data:
-            df_norm = self.dataframeUtils.norm_dataframe(dataframe)
+            df_norm = self.dataframeUtils.norm_dataframe(dataframe, key=self.curr_pair)
         else:
             df_norm = dataframe
 
@@ -917,7 +921,7 @@ class NNPredict(IStrategy):
         
         # pre-scale if needed
         if prescale_data:
-            df_norm = self.dataframeUtils.norm_dataframe(dataframe)
+            df_norm = self.dataframeUtils.norm_dataframe(dataframe, key=self.curr_pair)
 
         else:
             df_norm = dataframe
@@ -993,7 +997,7 @@ class NNPredict(IStrategy):
 
         # pre-scale if needed
         if prescale_data:
-            df_norm = self.dataframeUtils.norm_dataframe(dataframe)
+            df_norm = self.dataframeUtils.norm_dataframe(dataframe, key=self.curr_pair)
         else:
             df_norm = dataframe
 
@@ -1087,7 +1091,7 @@ class NNPredict(IStrategy):
     def get_compressor(self, df_norm: DataFrame):
         # just use fixed size PCA (easier for classifiers to deal with)
         ncols = int(64)
-        compressor = skd.PCA(n_components=ncols, whiten=True, svd_solver='full').fit(df_norm)
+        compressor = self.dataframeUtils.get_pca_compressor(df_norm, n_components=ncols, whiten=True, key=self.curr_pair)
         return compressor
 
     # compress the supplied dataframe
@@ -1255,12 +1259,9 @@ class NNPredict(IStrategy):
         if conditions:
             dataframe.loc[reduce(lambda x, y: x & y, conditions), "enter_long"] = 1
 
-        # set target to value predicted at previous buy signal
-        curr_target = 0.0
-        for i in range(len(dataframe["close"])):
-            if dataframe["enter_long"].iloc[i] > 0.0:
-                curr_target = dataframe["close"].iloc[i] * (1.0 + dataframe["predicted_gain"].iloc[i] / 100.0)
-            dataframe.loc[i, "curr_target"] = curr_target
+        # set target to value predicted at previous buy signal (carried forward until the next buy signal)
+        entry_target = dataframe["close"] * (1.0 + dataframe["predicted_gain"] / 100.0)
+        dataframe["curr_target"] = entry_target.where(dataframe["enter_long"] > 0.0).ffill().fillna(0.0)
 
         return dataframe
 
@@ -1347,6 +1348,9 @@ class NNPredict(IStrategy):
         if conditions:
             dataframe.loc[reduce(lambda x, y: x & y, conditions), "exit_long"] = 1
 
+        # save the fields used by custom_exit()
+        self.update_exit_candles(dataframe, metadata["pair"])
+
         return dataframe
 
     ###################################
@@ -1446,8 +1450,7 @@ class NNPredict(IStrategy):
     def custom_exit(
         self, pair: str, trade: Trade, current_time: "datetime", current_rate: float, current_profit: float, **kwargs
     ):
-        dataframe, _ = self.dp.get_analyzed_dataframe(pair=pair, timeframe=self.timeframe)
-        last_candle = dataframe.iloc[-1].squeeze()
+        last_candle = self.get_last_candle(pair, current_time)
 
         if not self.use_custom_stoploss:
             return None
@@ -45,7 +45,6 @@ logging.disable(logging.WARNING)
 import  utils.custom_indicators as cta
 
 from sklearn.metrics import classification_report
-import sklearn.decomposition as skd
 
 from sklearn.metrics import make_scorer
 from sklearn.metrics import accuracy_score
@@ -81,6 +80,7 @@ import NNTClassifier
 
 from utils.Environment import Environment
 import utils.profiler as profiler
+from utils.LastCandleCache import LastCandleCache
 import pickle
 
 """
@@ -127,7 +127,7 @@ NNTC - Neural Net Trinary Classifier
 """
 
 
-class NNTC(IStrategy):
+class NNTC(LastCandleCache, IStrategy):
     plot_config = {
         'main_plot': {
             'close': {'color': 'cornflowerblue'},
@@ -197,6 +197,7 @@ class NNTC(IStrategy):
 
     curr_pair = ""
     custom_trade_info = {}
+    exit_candle_fields = ['fisher_wr', 'exit_long']  # last candle data used by custom_exit()
 
     # the following affect training of the model. Bigger numbers give better results, but take longer and use more memory
     seq_len = 8  # 'depth' of training sequence
@@ -371,6 +372,8 @@ class NNTC(IStrategy):
         # create and initialise instances of objects shared across pairs
         if self.dataframeUtils is None:
             self.dataframeUtils = DataframeUtils()
+            # normalisation results are only re-used in dry_run/live, where the same pairs are processed every candle
+            self.dataframeUtils.cache_norm_data = self.dp.runmode.value in ('dry_run', 'live')
 
         if self.dataframePopulator is None:
 
@@ -485,7 +488,7 @@ class NNTC(IStrategy):
         # future_df = self.add_future_data(dataframe.copy())
         future_df = dataframe.copy()
         future_df = self.dataframePopulator.add_hidden_indicators(future_df)
-        future_df = self.dataframePopulator.add_future_data(future_df, self.curr_lookahead)
+        future_df = self.dataframePopulator.add_future_data(future_df, self.curr_lookahead, pair=self.curr_pair)
 
         future_df['train_buy'] = 0.0
         future_df['train_sell'] = 0.0
@@ -597,11 +600,11 @@ class NNTC(IStrategy):
         remove_outliers = False
         if remove_outliers:
             # norm dataframe before splitting, otherwise variances are skewed
-            full_df_norm = self.dataframeUtils.norm_dataframe(dataframe)
+            full_df_norm = self.dataframeUtils.norm_dataframe(dataframe, key=self.curr_pair)
             full_df_norm, buys, sells = self.dataframeUtils.remove_outliers(full_df_norm, buys, sells)
         else:
-            # full_df_norm = self.dataframeUtils.norm_dataframe(dataframe).clip(lower=-3.0, upper=3.0)  # supress outliers
-            full_df_norm = self.dataframeUtils.norm_dataframe(dataframe)
+            # full_df_norm = self.dataframeUtils.norm_dataframe(dataframe, key=self.curr_pair).clip(lower=-3.0, upper=3.0)  # supress outliers
+            full_df_norm = self.dataframeUtils.norm_dataframe(dataframe, key=self.curr_pair)
 
         # compress data
         if self.compress_data:
@@ -794,7 +797,7 @@ class NNTC(IStrategy):
     def get_compressor(self, df_norm: DataFrame):
         #  use fixed size PCA (Tensorflow models need fixed inputs)
         ncols = min(self.COMPRESSED_SIZE, df_norm.shape[-1])
-        compressor = skd.PCA(n_components=ncols, whiten=True, svd_solver='full').fit(df_norm)
+        compressor = self.dataframeUtils.get_pca_compressor(df_norm, n_components=ncols, whiten=True, key=self.curr_pair)
 
         num_features = np.shape(df_norm)[-1]
         if num_features > 2.0 * ncols:
@@ -1012,7 +1015,7 @@ class NNTC(IStrategy):
 
         if clf is not None:
             # print("    predicting... - dataframe:", dataframe.shape)
-            df_norm = self.dataframeUtils.norm_dataframe(dataframe)
+            df_norm = self.dataframeUtils.norm_dataframe(dataframe, key=self.curr_pair)
             if self.compress_data:
                 df_norm = self.compress_dataframe(df_norm)
 
@@ -1189,6 +1192,9 @@ class NNTC(IStrategy):
         else:
             dataframe['exit_long'] = 0
 
+        # save the fields used by custom_exit()
+        self.update_exit_candles(dataframe, metadata['pair'])
+
         return dataframe
 
     ###################################
@@ -1220,8 +1226,7 @@ class NNTC(IStrategy):
     def custom_exit(self, pair: str, trade: Trade, current_time: 'datetime', current_rate: float,
                     current_profit: float, **kwargs):
 
-        dataframe, _ = self.dp.get_analyzed_dataframe(pair=pair, timeframe=self.timeframe)
-        last_candle = dataframe.iloc[-1].squeeze()
+        last_candle = self.get_last_candle(pair, current_time)
 
         # trade_dur = int((current_time.timestamp() - trade.open_date_utc.timestamp()) // 60)
         # max_profit = max(0, trade.calc_profit_ratio(trade.max_rate))
@@ -75,8 +75,11 @@ import utils.custom_indicators as cta
 
 import utils.Wavelets as Wavelets
 import utils.Forecasters as Forecasters
+import utils.ParallelRolling as ParallelRolling
 
 from utils.DataframeUtils import DataframeUtils, ScalerType  # pylint: disable=E0401
+from utils.LastCandleCache import LastCandleCache
+from utils.IndicatorStore import IndicatorStore
 
 log = logging.getLogger(__name__)
 # log.setLevel(logging.DEBUG)
@@ -87,7 +90,7 @@ warnings.simplefilter(action="ignore", category=UserWarning)
 pd.options.mode.chained_assignment = None  # default='warn'
 
 
-class TSPredict(IStrategy):
+class TSPredict(LastCandleCache, IStrategy):
     # Do *not* hyperopt for the roi and stoploss spaces
 
     plot_config = {
@@ -142,6 +145,8 @@ class TSPredict(IStrategy):
     process_only_new_candles = True
 
     custom_trade_info = {}  # pair-specific data
+    # last candle data used by custom_exit()
+    exit_candle_fields = ["volume", "guard_metric", "predicted_gain", "target_loss", "exit_long", "curr_target"]
     curr_pair = ""
 
     ###################################
@@ -159,6 +164,9 @@ class TSPredict(IStrategy):
     merge_indicators = False  # set to False to not merge indicators into prediction data
 
     use_rolling = False  # True = rolling (slow but realistic), False = Jumping (much faster, less realistic)
+    rolling_workers = 0  # >1 = run rolling predictions in parallel chunks using this many processes
+    rolling_chunk_size = 1024  # no. of rows per parallel chunk (results depend on this, not on rolling_workers)
+    rolling_warmup = 16  # no. of training steps replayed before each parallel chunk
     single_col_prediction = False  # True = use only gain. False = use all columns (better, but much slower)
 
     wavelet_type: Wavelets.WaveletType = Wavelets.WaveletType.DWT
@@ -204,6 +212,11 @@ class TSPredict(IStrategy):
 
     curr_dataframe: DataFrame = None
 
+    # if True, populated indicators are saved to disk in backtest/hyperopt, and re-used by later runs (and processes)
+    # with the same strategy code, settings, parameter values and data. See utils/IndicatorStore.py
+    use_indicator_store = False
+    indicator_store: IndicatorStore = None
+
     target_profit = 0.0
     target_loss = 0.0
 
@@ -370,6 +383,26 @@ class TSPredict(IStrategy):
 
         self.update_pairlist_data()
 
+        # re-use indicators from a previous run, if available
+        store_key = None
+        if self.use_indicator_store and (self.dp.runmode.value in ("backtest", "hyperopt")):
+            store_key = self.get_indicator_store_key(dataframe)
+            stored_df = self.indicator_store.load(store_key, dataframe)
+            if stored_df is not None:
+                if self.model is None:
+                    self.load_model(np.shape(stored_df))
+                if self.curr_pair not in self.custom_trade_info:
+                    self.custom_trade_info[self.curr_pair] = {
+                        "forecaster": None,
+                        "initialised": False,
+                        "predictions": None,
+                        "curr_prediction": 0.0,
+                        "curr_target": 0.0,
+                    }
+                return stored_df
+
+        input_cols = dataframe.columns
+
         # The following are needed for base functions, so do not remove.
         # Add custom indicators to add_strategy_indicators()
 
@@ -460,8 +493,25 @@ class TSPredict(IStrategy):
         # #DBG (cannot include this in 'real' strat because it's forward looking):
         # dataframe['dwt'] = self.get_dwt(dataframe['gain'])
 
+        # save for later runs (predictions are not valid in training mode)
+        if (store_key is not None) and (not self.training_mode):
+            self.indicator_store.save(store_key, dataframe, input_cols)
+
         return dataframe
 
+    # get the indicator store key for the current pair. The model file is part of the key, so retraining
+    # invalidates any stored predictions
+    def get_indicator_store_key(self, dataframe: DataFrame) -> str:
+        if self.indicator_store is None:
+            store_dir = group_dir + "/models/" + self.__class__.__name__ + "/indicators"
+            self.indicator_store = IndicatorStore(store_dir, root_dir=strat_dir)
+
+        model_path = self.get_model_path("")
+        model_stamp = os.path.getmtime(model_path) if os.path.exists(model_path) else None
+
+        return self.indicator_store.get_key(self, self.curr_pair, dataframe,
+                                            extra=(self.timeframe, model_stamp))
+
     def update_gain_targets(self, dataframe):
         # win_size = max(self.lookahead, 6)
         win_size = self.scale_len
@@ -816,6 +866,14 @@ class TSPredict(IStrategy):
 
     # alternate rolling prediction approach. The pandas rolling mechanism seems to have issues for some reason
     def rolling_predict(self, gain, window_size):
+        # use streaming version if the forecaster supports it (scaling needs the full prediction, so not in that case)
+        if self.forecaster.supports_streaming() and (not self.scale_results):
+            return self.streaming_rolling_predict(gain, window_size)
+
+        # use parallel version if configured (scaling relies on strategy state, so is only done serially)
+        if (self.rolling_workers > 1) and (not self.scale_results):
+            return self.parallel_rolling_predict(gain, window_size)
+
         win_size = window_size
 
         x = np.nan_to_num(np.array(gain))
@@ -875,6 +933,95 @@ class TSPredict(IStrategy):
 
         return preds
 
+    # -------------
+
+    # streaming version of rolling_predict(). The forecaster is started on the first window, then updated with one
+    # new value per row, so each prediction is O(1) rather than a refit of the whole window
+    def streaming_rolling_predict(self, gain, window_size):
+        win_size = window_size
+
+        x = np.nan_to_num(np.array(gain))
+        preds = np.zeros(len(x), dtype=float)
+
+        # get the forecaster for this pair
+        if self.custom_trade_info[self.curr_pair]["forecaster"] is None:
+            # make a deep copy so that we don't override the baseline model
+            pair_forecaster = copy.deepcopy(self.forecaster)
+        else:
+            pair_forecaster = self.custom_trade_info[self.curr_pair]["forecaster"]
+
+        min_start = self.wavelet_size + self.lookahead  # need buffer for training
+        end = win_size + min_start
+        if end <= len(x):
+            pair_forecaster.start_stream(self.training_data[end - win_size : end])
+            preds[end - 1] = pair_forecaster.predict_next(self.lookahead)
+
+        for end in range(win_size + min_start + 1, len(x) + 1):
+            pair_forecaster.update(self.training_data[end - 1])
+            preds[end - 1] = pair_forecaster.predict_next(self.lookahead)
+
+        preds = np.clip(preds, -3.0, 3.0)
+
+        # save the updated forecaster
+        self.custom_trade_info[self.curr_pair]["forecaster"] = pair_forecaster
+
+        return preds
+
+    # -------------
+
+    # get the latest prediction using the streaming interface of the forecaster. If the stream is in sync with the data
+    # (i.e. the window has moved on by exactly one value), then just add the latest value, otherwise restart from the
+    # current window
+    def streaming_predict(self, forecaster: Forecasters.base_forecaster, data):
+        x = np.nan_to_num(data)
+
+        if forecaster.stream_in_sync(x):
+            forecaster.update(x[-1])
+        else:
+            forecaster.start_stream(x)
+
+        return np.clip(np.array([forecaster.predict_next(self.lookahead)]), -3.0, 3.0)
+
+    # -------------
+
+    # parallel version of rolling_predict(). The timeline is split into chunks of rolling_chunk_size rows, which are
+    # run in a process pool. Each chunk starts from the same pair forecaster, warm-started with the training steps
+    # just before the chunk, so the results are reproducible (but not identical to the serial version)
+    def parallel_rolling_predict(self, gain, window_size):
+        x = np.nan_to_num(np.array(gain))
+        nrows = np.shape(self.training_data)[0]
+
+        # get the forecaster for this pair
+        if self.custom_trade_info[self.curr_pair]["forecaster"] is None:
+            # make a deep copy so that we don't override the baseline model
+            pair_forecaster = copy.deepcopy(self.forecaster)
+        else:
+            pair_forecaster = self.custom_trade_info[self.curr_pair]["forecaster"]
+
+        params = ParallelRolling.make_params(
+            win_size=window_size,
+            lookahead=self.lookahead,
+            train_len=self.train_len,
+            min_start=self.wavelet_size + self.lookahead,
+            nrows=nrows,
+            retrain=(not self.training_mode) and self.supports_incremental_training,
+            warmup=self.rolling_warmup,
+        )
+
+        preds, pair_forecaster = ParallelRolling.rolling_forecast(
+            pair_forecaster,
+            self.training_data[: len(x)],
+            self.training_labels[: len(x)],
+            params,
+            chunk_size=self.rolling_chunk_size,
+            num_workers=self.rolling_workers,
+        )
+
+        # save the updated/trained forecaster
+        self.custom_trade_info[self.curr_pair]["forecaster"] = pair_forecaster
+
+        return preds
+
     # ----------
     # add predictions in a jumping fashion. This is a compromise - the rolling version is very slow
     # Note: you probably need to manually tune the parameters, since there is some limited lookahead here
@@ -917,6 +1064,9 @@ class TSPredict(IStrategy):
         else:
             pair_forecaster = self.custom_trade_info[self.curr_pair]["forecaster"]
 
+        # state used to reset the model for each window (cheaper than a deepcopy per window)
+        reset_state = None
+
         # loop through the rows
         while end < nrows:
             # extract the data and coefficients from the current window
@@ -926,7 +1076,14 @@ class TSPredict(IStrategy):
             if (not self.training_mode) and (self.supports_incremental_training):
                 train_data = self.training_data[train_start:train_end].copy()
                 train_results = self.training_labels[train_start:train_end].copy()
-                pair_forecaster = copy.deepcopy(self.forecaster)  # reset to avoid over-training
+
+                # reset to avoid over-training
+                if reset_state is None:
+                    pair_forecaster = copy.deepcopy(self.forecaster)
+                    reset_state = pair_forecaster.snapshot()
+                else:
+                    pair_forecaster.restore(reset_state)
+
                 self.train_model(pair_forecaster, train_data, train_results, False)
                 # print(f'train_data: {np.shape(train_data)}')
                 # print(f'train_results: {np.shape(train_results)}')
@@ -1050,7 +1207,10 @@ class TSPredict(IStrategy):
 
             slen = min(clen, self.scale_len)
             self.gain_data = np.array(dataframe["gain"].iloc[-slen:])  # needed for scaling
-            preds = self.predict_data(pair_forecaster, self.training_data[-self.model_window :])
+            if pair_forecaster.supports_streaming() and (not self.scale_results):
+                preds = self.streaming_predict(pair_forecaster, self.training_data[-self.model_window :])
+            else:
+                preds = self.predict_data(pair_forecaster, self.training_data[-self.model_window :])
 
             # self.forecaster = copy.deepcopy(base_forecaster) # restore original model
 
@@ -1246,12 +1406,9 @@ class TSPredict(IStrategy):
         if conditions:
             dataframe.loc[reduce(lambda x, y: x & y, conditions), "enter_long"] = 1
 
-        # set target to value predicted at previous buy signal
-        curr_target = 0.0
-        for i in range(len(dataframe["close"])):
-            if dataframe["enter_long"].iloc[i] > 0.0:
-                curr_target = dataframe["close"].iloc[i] * (1.0 + dataframe["predicted_gain"].iloc[i] / 100.0)
-            dataframe.loc[i, "curr_target"] = curr_target
+        # set target to value predicted at previous buy signal (carried forward until the next buy signal)
+        entry_target = dataframe["close"] * (1.0 + dataframe["predicted_gain"] / 100.0)
+        dataframe["curr_target"] = entry_target.where(dataframe["enter_long"] > 0.0).ffill().fillna(0.0)
 
         return dataframe
 
@@ -1338,6 +1495,9 @@ class TSPredict(IStrategy):
         if conditions:
             dataframe.loc[reduce(lambda x, y: x & y, conditions), "exit_long"] = 1
 
+        # save the fields used by custom_exit()
+        self.update_exit_candles(dataframe, metadata["pair"])
+
         return dataframe
 
     ###################################
@@ -1437,8 +1597,7 @@ class TSPredict(IStrategy):
     def custom_exit(
         self, pair: str, trade: Trade, current_time: "datetime", current_rate: float, current_profit: float, **kwargs
     ):
-        dataframe, _ = self.dp.get_analyzed_dataframe(pair=pair, timeframe=self.timeframe)
-        last_candle = dataframe.iloc[-1].squeeze()
+        last_candle = self.get_last_candle(pair, current_time)
 
         if not self.use_custom_stoploss:
             return None
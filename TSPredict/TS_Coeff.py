@@ -119,37 +119,19 @@ class TS_Coeff(TSPredict):
             end = start + self.model_window - 1
         else:
             end = start + 32
-        dest = end
-
-        # print(f"nrows:{nrows} start:{start} end:{end} dest:{dest} nbuffs:{nbuffs}")
+        win_len = end - start
 
         self.coeff_table = None
-        num_coeffs = 0
-        init_done = False
-
-        while end < nrows:
-            dslice = data[start:end]
-
-            # print(f"start:{start} end:{end} dest:{dest} len:{len(dslice)}")
-
-            coeffs = self.wavelet.get_coeffs(dslice)
-            features = self.wavelet.coeff_to_array(coeffs)
-            # print(f'build_coefficient_table() features: {np.shape(features)}')
-
-            # initialise the np.array (need features first to know size)
-            if not init_done:
-                init_done = True
-                num_coeffs = len(features)
-                self.coeff_table = np.zeros((nrows, num_coeffs), dtype=float)
-                # print(f"coeff_table:{np.shape(self.coeff_table)}")
-
-            # copy the features to the appropriate row of the coefficient array (offset due to startup window)
-            self.coeff_table[dest] = features
 
-            start = start + 1
-            dest = dest + 1
-            end = end + 1
+        if win_len >= nrows:
+            return
 
+        # transform all windows in one batch. Window data[i:i+win_len] goes into row i+win_len
+        # (offset due to startup window)
+        features = self.wavelet.get_coeffs_windows(data[:nrows-1], win_len)
+        num_coeffs = np.shape(features)[1]
+        self.coeff_table = np.zeros((nrows, num_coeffs), dtype=float)
+        self.coeff_table[win_len:] = features
 
         # print(f'build_coefficient_table() self.coeff_table: {np.shape(self.coeff_table)}')
 
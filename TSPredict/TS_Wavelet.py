@@ -17,6 +17,7 @@ import pstats
 import traceback
 
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 # Get rid of pandas warnings during backtesting
 import pandas as pd
 from pandas import DataFrame, Series
@@ -116,6 +117,7 @@ class TS_Wavelet(TSPredict):
     # lookahead = 9
 
     coeff_table = None
+    raw_coeff_table = None
     coeff_table_offset = 0
     coeff_array = None
     coeff_start_col = 0
@@ -131,6 +133,9 @@ class TS_Wavelet(TSPredict):
     use_rolling = False # if True, also set single_col_prediction = True
     detrend_data = True # if True, also set single_col_prediction = True
     single_col_prediction = True
+    # if True, train a single (pooled) model across all coefficients, if the forecaster supports it. This is much faster,
+    # but the predictions are NOT the same as the default per-column models (one model sees every coefficient series)
+    multi_output_prediction = False
 
     # NOTE: can only use longer lengths with FFT, too slow otherwise
     wavelet_size = 64  # Windowing should match this. Longer = better but slower with edge effects. Should be even
@@ -235,13 +240,9 @@ class TS_Wavelet(TSPredict):
         return
 
 
-    # builds a numpy array of coefficients
-    def build_coefficient_table(self, start, end):
-
-        # print(f'start:{start} end:{end} self.win_size:{self.win_size}')
+    # lazy initialisation of vars (so that they can be changed in subclasses). Returns False if not possible
+    def init_coeff_table(self):
 
-
-        # lazy initialisation of vars (so thatthey can be changed in subclasses)
         if self.wavelet is None:
            self.wavelet = Wavelets.make_wavelet(self.wavelet_type)
 
@@ -259,7 +260,7 @@ class TS_Wavelet(TSPredict):
 
         if self.wavelet is None:
             print('    **** ERR: wavelet not specified')
-            return
+            return False
 
         # print(f'    Wavelet:{self.wavelet_type.name} Forecaster:{self.forecaster_type.name}')
 
@@ -269,35 +270,35 @@ class TS_Wavelet(TSPredict):
             print('               Reverting to single column predictionss')
             self.single_col_prediction = True
 
+        return True
+
+    #-------------
+
+    # builds a numpy array of coefficients
+    def build_coefficient_table(self, start, end):
+
+        # print(f'start:{start} end:{end} self.win_size:{self.win_size}')
+
+        if not self.init_coeff_table():
+            return
+
         self.coeff_table = None
         self.coeff_table_offset = start
 
-        features = None
-        nrows = end - start + 1
         row_start = max(self.wavelet_size, start) - 1 # don't run until we have enough data for the transform
 
-        c_table: np.array = []
-
-        max_features = 0
-        for row in range(row_start, end):
-            # dslice = data[start:end].copy()
-            win_start = max(0, row-self.wavelet_size+1)
-            dslice = self.data[win_start:row+1]
-
-            coeffs = self.wavelet.get_coeffs(dslice)
-            features = self.wavelet.coeff_to_array(coeffs)
-            features = np.array(features)
-            flen = len(features)
-            max_features = max(max_features, flen)
-            c_table.append(features)
+        # transform all windows in one batch. Window for row is data[row-wavelet_size+1:row+1]
+        c_table = self.wavelet.get_coeffs_windows(self.data[row_start-self.wavelet_size+1:end], self.wavelet_size)
 
-        # convert into a zero-padded fixed size array
-        nrows = len(c_table)
+        # copy into a zero-padded fixed size array
+        nrows = np.shape(c_table)[0]
+        max_features = np.shape(c_table)[1] if nrows > 0 else 0
         self.coeff_table = np.zeros((row_start+nrows, max_features), dtype=float)
-        for i in range(0, nrows):
-            flen = len(c_table[i]) # feature length
-            # print(f'    flen:{flen} c_table[{i}]:{len(c_table[i])}')
-            self.coeff_table[i+row_start-1][:flen] = np.array(c_table[i])
+        if nrows > 0:
+            self.coeff_table[row_start-1:row_start-1+nrows] = c_table
+
+        # save the raw table, before merging (used for incremental updates)
+        self.raw_coeff_table = self.coeff_table
 
         # merge data from main dataframe
         self.merge_coeff_table(start, end)
@@ -306,6 +307,96 @@ class TS_Wavelet(TSPredict):
         # print(self.coeff_table[15:48])
 
         return
+
+    #-------------
+
+    # incremental version of build_coefficient_table(0, end), for use in live modes.
+    # The raw table and the data used to build it are kept per pair in custom_trade_info. Only rows whose window
+    # contains new (or changed) data are recalculated, and rows that have scrolled off the start of the dataframe
+    # are dropped, so the result is identical to a full rebuild
+    def update_coefficient_table(self, dataframe: DataFrame, end):
+
+        store = self.custom_trade_info[self.curr_pair].get('coeff_store', None)
+
+        # no usable history, so just do a full rebuild
+        if (store is None) or ('date' not in dataframe.columns) or (end != len(self.data)):
+            self.build_coefficient_table(0, end)
+            self.save_coeff_store(dataframe)
+            return
+
+        if not self.init_coeff_table():
+            return
+
+        # find the last candle of the previous call in the current dataframe
+        dates = dataframe['date'].to_numpy()
+        pos = np.flatnonzero(dates == store['last_date'])
+        if len(pos) == 0:
+            self.build_coefficient_table(0, end)
+            self.save_coeff_store(dataframe)
+            return
+
+        # old row index = new row index - shift
+        old_data = store['data']
+        old_table = store['table']
+        shift = pos[-1] - (len(old_data) - 1)
+
+        # flag any data that is new or differs from the data used to build the old table
+        changed = np.ones(end, dtype=bool)
+        new_start = max(0, shift)
+        new_end = min(end, len(old_data) + shift)
+        if new_end > new_start:
+            changed[new_start:new_end] = self.data[new_start:new_end] != old_data[new_start-shift:new_end-shift]
+
+        # a row can be re-used only if its entire window is unchanged
+        win_changed = np.convolve(changed.astype(int), np.ones(self.wavelet_size, dtype=int))[:end] > 0
+
+        row_start = self.wavelet_size - 1
+        max_features = np.shape(old_table)[1]
+        self.coeff_table = np.zeros((end, max_features), dtype=float)
+        self.coeff_table_offset = 0
+
+        # always recalculate the last row, so that the wavelet state reflects the latest window
+        win_changed[end-1] = True
+
+        # re-use rows from the old table
+        rows = np.arange(row_start, end)
+        reuse = rows[~win_changed[row_start:end]]
+        self.coeff_table[reuse-1] = old_table[reuse-1-shift]
+
+        # transform the windows for the remaining rows in one batch (last row is processed last)
+        rows = rows[win_changed[row_start:end]]
+        windows = sliding_window_view(self.data[:end], self.wavelet_size)[rows-self.wavelet_size+1]
+        features = self.wavelet.get_coeffs_batch(windows)
+        if np.shape(features)[1] != max_features:
+            # transform size changed, cannot re-use anything
+            self.build_coefficient_table(0, end)
+            self.save_coeff_store(dataframe)
+            return
+        self.coeff_table[rows-1] = features
+
+        self.raw_coeff_table = self.coeff_table
+        self.save_coeff_store(dataframe)
+
+        # merge data from main dataframe
+        self.merge_coeff_table(0, end)
+
+        return
+
+    #-------------
+
+    # save the raw coefficient table (and the data used to create it) for the current pair
+    def save_coeff_store(self, dataframe: DataFrame):
+        if self.raw_coeff_table is None or ('date' not in dataframe.columns):
+            self.custom_trade_info[self.curr_pair]['coeff_store'] = None
+            return
+
+        self.custom_trade_info[self.curr_pair]['coeff_store'] = {
+            'last_date': dataframe['date'].to_numpy()[-1],
+            'data': self.data.copy(),
+            'table': self.raw_coeff_table.copy()
+        }
+        return
+
     #-------------
 
     # merge the supplied dataframe with the coefficient table. Number of rows must match
@@ -389,39 +480,52 @@ class TS_Wavelet(TSPredict):
 
         # print(f'start:{start} end:{end} train_start:{train_start} train_end:{train_end} nrows:{nrows}')
 
-        # train/predict for each coefficient individually
-        for i in range(self.coeff_start_col, ncols):
+        # train/predict all coefficients with a single (stacked) model, if supported. Much faster than per-column models
+        if self.multi_output_prediction and self.single_col_prediction and self.forecaster.supports_multi_output():
+            col_forecaster = self.col_forecasters[0]
+            predict_data = self.coeff_table[start:end, self.coeff_start_col:]
 
-            # get the data buffers from self.coeff_table
-            # if single column, then just use a single coefficient
-            if self.single_col_prediction:
-                predict_data = self.coeff_table[start:end, i].reshape(-1,1)
-                predict_data = np.nan_to_num(predict_data)
-                train_data = self.coeff_table[train_start:train_end, i].reshape(-1,1)
+            if self.forecaster.requires_pretraining():
+                train_data = self.coeff_table[train_start:train_end, self.coeff_start_col:]
+                results = self.coeff_table[results_start:results_end, self.coeff_start_col:]
+                col_forecaster.train_multi(train_data, results, incremental=True)
 
-            results = self.coeff_table[results_start:results_end, i]
+            coeff_arr = list(col_forecaster.forecast_multi(predict_data, self.lookahead))
 
-            col_forecaster = self.col_forecasters[i-self.coeff_start_col]
+        else:
+            # train/predict for each coefficient individually
+            for i in range(self.coeff_start_col, ncols):
 
-            # print(f'predict_data: {np.shape(predict_data)}')
-            # print(f'train_data: {np.shape(train_data)}')
-            # print(f'results: {np.shape(results)}')
+                # get the data buffers from self.coeff_table
+                # if single column, then just use a single coefficient
+                if self.single_col_prediction:
+                    predict_data = self.coeff_table[start:end, i].reshape(-1,1)
+                    predict_data = np.nan_to_num(predict_data)
+                    train_data = self.coeff_table[train_start:train_end, i].reshape(-1,1)
 
-            if self.forecaster.requires_pretraining():
-                # since we know we are switching data surces, disable incremental training
-                col_forecaster.train(train_data, results, incremental=True)
+                results = self.coeff_table[results_start:results_end, i]
+
+                col_forecaster = self.col_forecasters[i-self.coeff_start_col]
 
-            # get a prediction
-            preds = col_forecaster.forecast(predict_data, self.lookahead)
+                # print(f'predict_data: {np.shape(predict_data)}')
+                # print(f'train_data: {np.shape(train_data)}')
+                # print(f'results: {np.shape(results)}')
 
-            if preds.ndim > 1:
-                preds = preds.squeeze()
+                if self.forecaster.requires_pretraining():
+                    # since we know we are switching data surces, disable incremental training
+                    col_forecaster.train(train_data, results, incremental=True)
 
-            # # smooth predictions to try and avoid drastic changes
-            # preds = self.smooth(preds, 2)
+                # get a prediction
+                preds = col_forecaster.forecast(predict_data, self.lookahead)
 
-            # append prediction for this column
-            coeff_arr.append(preds[-1])
+                if preds.ndim > 1:
+                    preds = preds.squeeze()
+
+                # # smooth predictions to try and avoid drastic changes
+                # preds = self.smooth(preds, 2)
+
+                # append prediction for this column
+                coeff_arr.append(preds[-1])
 
         # convert back to gain
         c_array = np.array(coeff_arr)
@@ -641,7 +745,6 @@ class TS_Wavelet(TSPredict):
 
         try:
             # set up training data
-            #TODO: see if we can do this incrementally instead of rebuilding every time, or just use portion of data
             future_gain_data = self.get_future_gain(df)
             self.set_data(dataframe)
 
@@ -673,7 +776,8 @@ class TS_Wavelet(TSPredict):
 
             # # build the coefficient table for (only) the prediction range)
             # self.build_coefficient_table(start, end)
-            self.build_coefficient_table(0, end)
+            # only add the rows for new candles (same result as build_coefficient_table(0, end))
+            self.update_coefficient_table(dataframe, end)
 
             preds = self.predict_data(start, end)
 
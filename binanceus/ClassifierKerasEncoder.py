@@ -52,6 +52,7 @@ class ClassifierKerasEncoder(ClassifierKeras):
 
     clean_data_required = False
     encoder_layer = 'encoder_output'
+    stream_predictions = True  # autoencoder, so predict_stream() can be used
 
     # create model - subclasses should overide this
     def create_model(self, seq_len, num_features):
@@ -179,6 +180,7 @@ class ClassifierKerasEncoder(ClassifierKeras):
 
         self.save()
         self.is_trained = True
+        self.train_count = self.train_count + 1
 
         return
 
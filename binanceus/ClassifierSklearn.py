@@ -194,25 +194,26 @@ class ClassifierSklearn():
             print("    ERR: no classifier")
             return np.zeros(np.shape(df_norm)[0])
 
-        has_predict = getattr(self.model, "predict", None)
-        if callable(has_predict):
-            pred = self.model_predict(df_norm)
-
-        else:
-            # some sklearn classifiers have fit_predict instead
-            has_fit_predict = getattr(self.model, "fit_predict", None)
-            if callable(has_fit_predict):
-                pred = self.model.fit_predict(df_norm)
-            else:
-                print("    ERR: classifier does not have a predict() or fit_predict() method")
-                return np.zeros(np.shape(df_norm)[0])
-
-
         # not all sklearn algorithms support score_samples method, so double-check
         has_scores = getattr(self.model, "score_samples", None)
         if not callable(has_scores):
             self.use_scores = False
 
+        # if scores are used, the predictions are not needed (and predict() often just re-calculates the scores)
+        if not self.use_scores:
+            has_predict = getattr(self.model, "predict", None)
+            if callable(has_predict):
+                pred = self.model_predict(df_norm)
+
+            else:
+                # some sklearn classifiers have fit_predict instead
+                has_fit_predict = getattr(self.model, "fit_predict", None)
+                if callable(has_fit_predict):
+                    pred = self.model.fit_predict(df_norm)
+                else:
+                    print("    ERR: classifier does not have a predict() or fit_predict() method")
+                    return np.zeros(np.shape(df_norm)[0])
+
         if self.use_scores:
             scores = self.model.score_samples(df_norm)
             # thresh = np.quantile(scores, self.contamination)
@@ -221,7 +222,7 @@ class ClassifierSklearn():
             #                                                                           scores.min(), scores.max(),
             #                                                                           scores.mean(), scores.std()))
             index = np.where(scores <= thresh)
-            predictions = np.zeros(np.shape(pred)[0])
+            predictions = np.zeros(np.shape(scores)[0])
             predictions[index] = 1.0
         else:
             predictions = pd.Series(pred).replace([-1, 1], [1.0, 0.0])
@@ -0,0 +1,201 @@
+# Utilities for choosing the best classifier from a list of candidates
+#
+# Evaluating every candidate on the full training data is slow, and most of the time is spent on candidates that
+# are clearly not going to win. Instead, this runs a 'tournament' using successive halving:
+#   - every candidate is fitted on a fraction of the training data, and scored against the (full) test data
+#   - the best half go through to the next round, which uses a larger fraction of the training data
+#   - the final round uses all of the training data, so the winner is fitted exactly as it would be normally
+# Scoring uses the single train/test split supplied by the caller (as before), not k-fold cross-validation.
+# Candidates within a round are fitted concurrently, each in its own process. Candidates that fail are eliminated.
+# If a time budget is set, a candidate whose fit runs longer than the budget is terminated (and eliminated), so that
+# a slow fit cannot hold up the rest of the tournament, or keep running in the background.
+#
+# The worker function lives here (rather than in the strategy) so that it can be pickled by multiprocessing.
+
+import multiprocessing
+import time
+from multiprocessing import connection
+
+import numpy as np
+from sklearn.metrics import f1_score
+
+
+# fit a single candidate and score it against the test data
+def fit_and_score(clf, x_train, y_train, x_test, y_test):
+    start = time.time()
+    clf = clf.fit(x_train, y_train)
+    pred_test = clf.predict(x_test)
+    score = f1_score(y_test, pred_test, average='macro')
+    return clf, score, time.time() - start
+
+
+# get the number of training rows used in each round.
+# Starts with min_fraction of the data, and multiplies by eta each round until all of the data is used
+def get_schedule(nrows, num_candidates, min_fraction=0.25, eta=2):
+    sizes = [nrows]
+    size = nrows
+    remaining = num_candidates
+    while remaining > 1:
+        size = int(size / eta)
+        if size < nrows * min_fraction:
+            break
+        sizes.insert(0, size)
+        remaining = int(np.ceil(remaining / eta))
+    return sizes
+
+
+# child process: fit a single candidate and send the result (or the error) back through the pipe
+def run_candidate(conn, clf, x_train, y_train, x_test, y_test):
+    try:
+        conn.send(("ok", fit_and_score(clf, x_train, y_train, x_test, y_test)))
+    except Exception as e:
+        conn.send(("error", str(e)))
+    finally:
+        conn.close()
+
+
+# stop a candidate process (if still running) and release its pipe
+def stop_candidate(conn, proc):
+    if proc.is_alive():
+        proc.terminate()
+    proc.join()
+    conn.close()
+    return
+
+
+# run a single round, returns dict of {name: (clf, score, time)} for the candidates that completed.
+# Up to num_workers candidates run at once, each in its own process so that it can be terminated when it goes over
+# time_budget (seconds, measured from the start of that candidate's fit). With no budget and a single worker, the
+# candidates are just fitted in this process
+def run_round(candidates, x_train, y_train, x_test, y_test, num_workers, time_budget):
+    results = {}
+
+    if (num_workers <= 1) and (time_budget <= 0.0):
+        for name, clf in candidates.items():
+            try:
+                results[name] = fit_and_score(clf, x_train, y_train, x_test, y_test)
+            except Exception as e:
+                print("    Error fitting {}: {}".format(name, e))
+        return results
+
+    pending = list(candidates.items())
+    running = {}  # {pipe connection: (name, process, deadline)}
+
+    try:
+        while (len(pending) > 0) or (len(running) > 0):
+
+            # start candidates while there are free workers
+            while (len(pending) > 0) and (len(running) < max(1, num_workers)):
+                name, clf = pending.pop(0)
+                recv_conn, send_conn = multiprocessing.Pipe(duplex=False)
+                proc = multiprocessing.Process(target=run_candidate,
+                                               args=(send_conn, clf, x_train, y_train, x_test, y_test))
+                proc.start()
+                send_conn.close()
+                deadline = (time.time() + time_budget) if (time_budget > 0.0) else None
+                running[recv_conn] = (name, proc, deadline)
+
+            # wait for a result, or until the next deadline
+            timeout = None
+            deadlines = [deadline for (_, _, deadline) in running.values() if deadline is not None]
+            if len(deadlines) > 0:
+                timeout = max(0.0, min(deadlines) - time.time())
+
+            for conn in connection.wait(list(running.keys()), timeout=timeout):
+                name, proc, _ = running.pop(conn)
+                try:
+                    status, value = conn.recv()
+                except EOFError:
+                    status, value = "error", "worker process died"
+                stop_candidate(conn, proc)
+
+                if status == "ok":
+                    results[name] = value
+                else:
+                    print("    Error fitting {}: {}".format(name, value))
+
+            # terminate anything that is over budget
+            now = time.time()
+            for conn, (name, proc, deadline) in list(running.items()):
+                if (deadline is not None) and (now >= deadline):
+                    del running[conn]
+                    stop_candidate(conn, proc)
+                    print("    {} exceeded time budget ({:.1f}s). Terminated".format(name, time_budget))
+
+    finally:
+        # make sure that nothing is left running (e.g. if interrupted)
+        for conn, (_, proc, _) in running.items():
+            stop_candidate(conn, proc)
+
+    return results
+
+
+# run the tournament.
+# candidates is a dict of {name: (unfitted) classifier}. Training rows are assumed to be already shuffled.
+# Returns the name of the best classifier, the fitted classifier, its score and a dict of the latest score
+# for every candidate that completed at least one round
+def run_tournament(candidates: dict, x_train, y_train, x_test, y_test,
+                   num_workers=4, time_budget=0.0, min_fraction=0.25, eta=2, verbose=False):
+
+    scores = {}
+    best_name = ""
+    best_clf = None
+    best_score = -1.0
+
+    if len(candidates) == 0:
+        return best_name, best_clf, best_score, scores
+
+    x_train = np.asarray(x_train)
+    y_train = np.asarray(y_train)
+    x_test = np.asarray(x_test)
+    y_test = np.asarray(y_test)
+
+    schedule = get_schedule(len(y_train), len(candidates), min_fraction=min_fraction, eta=eta)
+
+    remaining = dict(candidates)
+    results = {}
+
+    for rnum, nrows in enumerate(schedule):
+        last_round = (rnum == len(schedule) - 1)
+
+        # partial rounds need both classes in the training data, otherwise just skip ahead
+        if (not last_round) and (len(np.unique(y_train[:nrows])) < 2):
+            continue
+
+        results = run_round(remaining, x_train[:nrows], y_train[:nrows], x_test, y_test,
+                            num_workers, time_budget)
+
+        for name, (_, score, _) in results.items():
+            scores[name] = score
+
+        if verbose:
+            print("      Round {} ({} rows):".format(rnum + 1, nrows))
+            for name, (_, score, elapsed) in sorted(results.items(), key=lambda r: -r[1][1]):
+                print("        {0:<20}: {1:.3f} ({2:.2f}s)".format(name, score, elapsed))
+
+        # report anything that failed or was terminated (so that it is clear why it was not selected)
+        failed = [name for name in remaining.keys() if name not in results]
+        if len(failed) > 0:
+            print("      Round {}: eliminated (failed/over time budget): {}".format(rnum + 1, ", ".join(failed)))
+
+        if len(results) == 0:
+            break
+
+        if last_round:
+            break
+
+        # keep the best 1/eta of the candidates (always keep at least one)
+        ranked = sorted(results.keys(), key=lambda n: -results[n][1])
+        keep = max(1, int(np.ceil(len(ranked) / eta)))
+        remaining = {name: candidates[name] for name in ranked[:keep]}
+        if len(ranked) > keep:
+            print("      Round {}: eliminated (score): {}".format(rnum + 1, ", ".join(ranked[keep:])))
+
+    # winner is taken from the last round that ran
+    for name, (clf, score, _) in results.items():
+        if score > best_score:
+            best_name = name
+            best_clf = clf
+            best_score = score
+
+    return best_name, best_clf, best_score, scores
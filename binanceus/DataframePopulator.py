@@ -6,6 +6,7 @@
 import math
 
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 import pandas as pd
 
 import pywt
@@ -63,9 +64,27 @@ class DataframePopulator():
 
     dataframeUtils = None
 
+    # DWT model parameters (used by get_dwt() and rolling_dwt())
+    dwt_wavelet = 'db8'
+    dwt_level = 1
+    dwt_wmode = "smooth"
+    dwt_tmode = "hard"
+    dwt_weights = {}  # cached reconstruction weights for rolling_dwt()
+
+    # if True, add_future_data() caches the results per pair in dry_run/live modes (ignored in other modes), and only
+    # recomputes the tail when the window moves. See add_future_data() for the differences from the uncached version
+    cache_future_data = True
+    future_cache = None  # per-pair cache of future data
+
+    # compact mode: add_indicators() stores indicators as float32 and drops intermediate (scratch) columns.
+    # Roughly halves memory use, but note that the set of columns changes, so models trained without it will not match
+    compact_indicators = False
+    scratch_columns = ['dwt_dir_up', 'dwt_dir_dn', 'hl2']
+
     def __init__(self):
         super().__init__()
         self.dataframeUtils = DataframeUtils()
+        self.future_cache = {}
 
     #################
 
@@ -129,7 +148,8 @@ class DataframePopulator():
         # if in backtest or hyperopt, then we have to do rolling calculations
         if self.runmode in ('hyperopt', 'backtest', 'plot'):
             # dataframe['dwt'] = dataframe['close'].rolling(window=self.startup_win).apply(self.roll_get_dwt)
-            dataframe['dwt'] = dataframe['mid'].rolling(window=self.startup_win).apply(self.roll_get_dwt)
+            # dataframe['dwt'] = dataframe['mid'].rolling(window=self.startup_win).apply(self.roll_get_dwt)
+            dataframe['dwt'] = self.rolling_dwt(dataframe['mid'], self.startup_win)
         else:
             # dataframe['dwt'] = self.get_dwt(dataframe['close'])
             dataframe['dwt'] = self.get_dwt(dataframe['mid'])
@@ -164,7 +184,7 @@ class DataframePopulator():
         dataframe['dwt_nseq_dn'] = dataframe['dwt_nseq_dn'].clip(lower=0.0, upper=20.0)
 
         # rolling linear slope of the DWT (i.e. average trend) of near-past
-        dataframe['dwt_slope'] = dataframe['dwt'].rolling(window=6).apply(self.roll_get_slope)
+        dataframe['dwt_slope'] = cta.rolling_slope(dataframe['dwt'], 6)
 
         return dataframe
 
@@ -477,6 +497,8 @@ class DataframePopulator():
 
     def add_indicators(self, dataframe: DataFrame, dataset_type=DatasetType.DEFAULT) -> DataFrame:
 
+        input_cols = dataframe.columns
+
         if dataset_type == DatasetType.DEFAULT:
             dataframe = self.add_default_indicators(dataframe)
         elif dataset_type == DatasetType.MINIMAL:
@@ -500,6 +522,30 @@ class DataframePopulator():
         # TODO: fix NaNs
         dataframe.fillna(0.0, inplace=True)
 
+        if self.compact_indicators:
+            dataframe = self.compact_dataframe(dataframe, input_cols)
+
+        return dataframe
+
+    # downcast the indicators to float32 and remove scratch columns. Columns in keep_cols (e.g. the original OHLCV
+    # data) are not changed
+    def compact_dataframe(self, dataframe: DataFrame, keep_cols) -> DataFrame:
+
+        start_size = dataframe.memory_usage(index=False).sum()
+
+        drop_cols = [c for c in self.scratch_columns if (c in dataframe.columns) and (c not in keep_cols)]
+        if len(drop_cols) > 0:
+            dataframe = dataframe.drop(columns=drop_cols)
+
+        float_cols = [c for c in dataframe.select_dtypes(include=['float64']).columns if c not in keep_cols]
+        if len(float_cols) > 0:
+            dataframe = dataframe.astype({c: np.float32 for c in float_cols})
+
+        if self.runmode not in ('dry_run', 'live'):
+            end_size = dataframe.memory_usage(index=False).sum()
+            print(f"    Compact indicators: {start_size / 1e6:.1f}MB -> {end_size / 1e6:.1f}MB"
+                  f" ({len(float_cols)} columns float32, {len(drop_cols)} dropped)")
+
         return dataframe
 
     ################################
@@ -548,7 +594,85 @@ class DataframePopulator():
         return dataframe
 
     # calculate future gains. Used for setting targets. Yes, we lookahead in the data!
-    def add_future_data(self, dataframe: DataFrame, lookahead: int) -> DataFrame:
+    # columns used as input by build_future_data() ('full_dwt' is derived from 'close')
+    future_input_cols = ['close', 'dwt', 'dwt_profit_mean', 'dwt_profit_std', 'dwt_loss_mean', 'dwt_loss_std']
+
+    # add forward-looking data (for training labels). If a pair is supplied (and in dry_run/live mode), the result is
+    # cached. Repeated calls for the same candle just use the cache, and if the window has moved (new candles appended,
+    # and possibly old candles dropped from the start), only the tail of the data is recomputed.
+    # Note that 'full_dwt' models the whole dataframe, so every value changes slightly whenever the window moves.
+    # Re-used rows keep the values calculated when they were first seen (i.e. they are not updated for the new
+    # full_dwt), so the cached results are NOT identical to the uncached version, except for the recomputed tail.
+    # Rows are only re-used up to the first change in the (other) inputs
+    def add_future_data(self, dataframe: DataFrame, lookahead: int, pair: str = "") -> DataFrame:
+
+        if (not self.cache_future_data) or (self.runmode not in ('dry_run', 'live')) or \
+                (not pair) or ('date' not in dataframe.columns):
+            return self.build_future_data(dataframe, lookahead)
+
+        lookahead_win = max(lookahead, 14)
+        nrows = len(dataframe)
+        dates = dataframe['date'].values.astype('datetime64[ns]').astype('int64')
+        key = (lookahead, self.win_size)
+
+        # no. of rows whose future data depend on candles that were not available last time (i.e. max forward reach)
+        tail_len = max(lookahead_win, 2 * self.win_size)
+
+        # no. of extra rows needed before a recalculated section so that the rolling windows are complete
+        context_len = lookahead_win + 2 * self.win_size + 32
+
+        # only the input columns are needed for the calculation (much faster than working with the whole dataframe)
+        input_df = dataframe[[c for c in self.future_input_cols if c in dataframe.columns]]
+        rows = self.dataframeUtils.get_row_hashes(input_df.to_numpy(dtype=float))
+
+        # find out how many rows can be re-used from the cache, after allowing for any rows dropped from the start
+        reuse = 0
+        ndrop = 0
+        cache = self.future_cache.get(pair, None)
+        if (cache is not None) and (cache['key'] == key) and (nrows > 0):
+            cdates = cache['dates']
+            ndrop = int(np.searchsorted(cdates, dates[0]))
+            nkeep = min(len(cdates) - ndrop, nrows)
+            if (nkeep > 0) and (cdates[ndrop] == dates[0]) and np.array_equal(cdates[ndrop:ndrop + nkeep],
+                                                                                dates[:nkeep]):
+                same = cache['rows'][ndrop:ndrop + nkeep] == rows[:nkeep]
+                first_change = np.argmin(same) if not same.all() else nkeep
+                if (ndrop == 0) and (nkeep == nrows) and (first_change == nrows) and (len(cdates) == nrows):
+                    # same data as last time
+                    reuse = nrows
+                else:
+                    reuse = nkeep - tail_len
+                    if first_change < nkeep:
+                        reuse = min(reuse, first_change - context_len)
+
+        if reuse <= 2 * context_len:
+            # nothing (useful) in the cache, so do the full calculation
+            new_df = self.build_future_data(input_df, lookahead)
+            cols = [c for c in new_df.columns if c not in dataframe.columns]
+            values = new_df[cols].to_numpy(dtype=float)
+            block = values.copy()
+
+        else:
+            cols = cache['cols']
+            block = np.empty((nrows, len(cols)), dtype=float)
+            block[:reuse] = cache['block'][ndrop:ndrop + reuse]
+
+            if reuse < nrows:
+                # recalculate the tail (with context, so that the rolling windows are complete)
+                start = reuse - context_len
+                full_dwt = self.get_dwt(dataframe['close'])
+                tail_df = self.build_future_data(input_df.iloc[start:], lookahead, full_dwt=full_dwt[start:])
+                block[reuse:] = tail_df[cols].to_numpy(dtype=float)[context_len:]
+
+            values = block.copy()
+
+        future_df = pd.concat([dataframe, DataFrame(values, columns=cols, index=dataframe.index)], axis=1)
+
+        self.future_cache[pair] = {'key': key, 'dates': dates, 'cols': cols, 'block': block, 'rows': rows}
+
+        return future_df
+
+    def build_future_data(self, dataframe: DataFrame, lookahead: int, full_dwt=None) -> DataFrame:
 
         lookahead_win = max(lookahead, 14)
 
@@ -563,7 +687,9 @@ class DataframePopulator():
             price_col = 'full_dwt'
 
             # get the 'full' DWT transform. This models the entire dataframe, so cannot be used in the 'main' dataframe
-            future_df['full_dwt'] = self.get_dwt(dataframe['close'])
+            if full_dwt is None:
+                full_dwt = self.get_dwt(dataframe['close'])
+            future_df['full_dwt'] = full_dwt
 
         else:
             price_col = 'close'
@@ -668,7 +794,7 @@ class DataframePopulator():
 
 
         # rolling linear slope of the DWT (i.e. average trend) of near-past (shifted forward)
-        future_df['future_slope'] = future_df['future_dwt'].rolling(window=6).apply(self.roll_get_slope)
+        future_df['future_slope'] = cta.rolling_slope(future_df['future_dwt'], 6)
 
         # get average gain & stddev
         profit_mean = future_df['future_profit'].mean()
@@ -763,12 +889,12 @@ class DataframePopulator():
         # the choice of wavelet makes a big difference
         # for an overview, check out: https://www.kaggle.com/theoviel/denoising-with-direct-wavelet-transform
         # wavelet = 'db1'
-        wavelet = 'db8'
         # wavelet = 'bior1.1'
         # wavelet = 'haar'  # deals well with harsh transitions
-        level = 1
-        wmode = "smooth"
-        tmode = "hard"
+        wavelet = self.dwt_wavelet
+        level = self.dwt_level
+        wmode = self.dwt_wmode
+        tmode = self.dwt_tmode
         length = len(data)
 
         # Apply DWT transform
@@ -790,6 +916,64 @@ class DataframePopulator():
         return model[0:len(model) - diff]
         # return model[diff:]
 
+    # vectorised equivalent of col.rolling(window=window).apply(self.roll_get_dwt)
+    # All windows are normalised, decomposed and thresholded as a batch. Only the last sample of each window is
+    # reconstructed: waverec is linear, so this is just a dot product with the (cached) response of the last
+    # sample to each coefficient
+    def rolling_dwt(self, col, window, chunk_size=8192) -> np.array:
+
+        a = np.array(col, dtype=float)
+        nrows = len(a)
+        result = np.full(nrows, np.nan)
+        if nrows < window:
+            return result
+
+        windows = sliding_window_view(a, window)
+
+        # process in chunks to limit memory usage
+        for start in range(0, len(windows), chunk_size):
+            chunk = windows[start:start+chunk_size]
+
+            # de-trend each window
+            w_mean = chunk.mean(axis=1, keepdims=True)
+            w_std = chunk.std(axis=1, keepdims=True)
+            a_notrend = (chunk - w_mean) / w_std
+
+            # Apply DWT transform to all windows
+            coeff = pywt.wavedec(a_notrend, self.dwt_wavelet, mode=self.dwt_wmode, axis=-1)
+
+            # remove higher harmonics (per-window threshold)
+            detail = coeff[-self.dwt_level]
+            sigma = (1 / 0.6745) * np.mean(np.absolute(detail - detail.mean(axis=1, keepdims=True)), axis=1)
+            uthresh = (sigma * np.sqrt(2 * np.log(window)))[:, np.newaxis]
+
+            if self.dwt_tmode == 'hard':
+                coeff[1:] = [c * (np.abs(c) >= uthresh) for c in coeff[1:]]
+            else:
+                coeff[1:] = [pywt.threshold(c, value=uthresh, mode=self.dwt_tmode) for c in coeff[1:]]
+
+            # reconstruct last sample of each window, then re-trend
+            weights = self.get_dwt_weights(window, [np.shape(c)[1] for c in coeff])
+            model = np.concatenate(coeff, axis=1) @ weights
+            result[start+window-1:start+window-1+len(chunk)] = (model * w_std[:, 0]) + w_mean[:, 0]
+
+        # pandas rolling() skips windows containing NaNs
+        has_nan = np.convolve(np.isnan(a), np.ones(window, dtype=int))[:nrows] > 0
+        result[has_nan] = np.nan
+
+        return result
+
+    # get the contribution of each (flattened) DWT coefficient to the last sample of the reconstructed window
+    def get_dwt_weights(self, window, sizes) -> np.array:
+        key = (window, tuple(sizes))
+        if key not in self.dwt_weights:
+            # reconstruct from unit impulses, one per coefficient
+            ncoeffs = sum(sizes)
+            basis = np.split(np.eye(ncoeffs), np.cumsum(sizes)[:-1], axis=1)
+            model = pywt.waverec(basis, self.dwt_wavelet, mode=self.dwt_wmode, axis=-1)
+            self.dwt_weights[key] = model[:, window-1].copy()
+        return self.dwt_weights[key]
+
     def madev(self, d, axis=None):
         """ Mean absolute deviation of a signal """
         return np.mean(np.absolute(d - np.mean(d, axis)), axis)
@@ -3,6 +3,8 @@
 # that we can then run multiple strategies simultaneously - if everything were to be static, one strat could reset
 # state needed by another strat. Also, you may sometimes need to process multiple dataframes at the same time
 
+import copy
+
 import numpy as np
 import pandas as pd
 
@@ -24,6 +26,8 @@ from pandas import DataFrame, Series
 from datetime import datetime, timedelta, timezone
 from sklearn.model_selection import RandomizedSearchCV, train_test_split
 from sklearn.preprocessing import LabelEncoder, StandardScaler, RobustScaler, MinMaxScaler
+import sklearn.decomposition as skd
+import hashlib
 
 pd.options.mode.chained_assignment = None  # default='warn'
 
@@ -44,6 +48,12 @@ class DataframeUtils():
     scaler_type:ScalerType = ScalerType.NoScaling
     scaler_fitted = False
 
+    # if True, norm_dataframe() re-uses results for repeated calls with the same key & data. This keeps a copy of the
+    # normalised data (and, for Robust, the raw & sorted data) for every key, so it is only worth enabling in
+    # dry_run/live modes, where the same pairs are processed every candle (strategies set this when they create it)
+    cache_norm_data = False
+    norm_cache = None  # per-key normalisation contexts
+
 
     # sets the type of scaler desired, and initialises associated vars
     def set_scaler_type(self, type:ScalerType):
@@ -119,11 +129,35 @@ class DataframeUtils():
     ###################################
 
     # Normalise a dataframe
-    def norm_dataframe(self, dataframe: DataFrame) -> DataFrame:
+    # If key is supplied (usually the pair), the result is cached, and repeated calls with the same data (e.g. within
+    # the same candle) just return a copy. When the scaler has been reset, it is re-fitted using the context from the
+    # previous call for that key where possible, rather than fitting from scratch
+    def norm_dataframe(self, dataframe: DataFrame, key="") -> DataFrame:
 
         self.check_inf(dataframe)
 
+        ctx = None
+        inputs = None
+        if key and self.cache_norm_data and (self.scaler_type != ScalerType.NoScaling):
+            if self.norm_cache is None:
+                self.norm_cache = {}
+
+            inputs = self.get_norm_inputs(dataframe)
+            ctx = self.norm_cache.get(key, None)
+            if (ctx is not None) and ((ctx['type'] != self.scaler_type) or
+                                      (ctx['in_cols'] != tuple(dataframe.columns))):
+                ctx = None
+
+            if (ctx is not None) and self.same_norm_inputs(ctx['inputs'], inputs):
+                # same data as last time. Restore the associated scaler if the current one has been reset
+                if not self.scaler_fitted:
+                    self.scaler = ctx['scaler']
+                    self.scaler_fitted = True
+                if self.scaler is ctx['scaler']:
+                    return ctx['df_norm'].copy()
+
         df = dataframe.copy()
+        sorted_window = None
 
         # if no scaling then just return a copy
         if self.scaler_type == ScalerType.NoScaling:
@@ -158,13 +192,186 @@ class DataframeUtils():
         # Note that fitting is only done once, then reused on subsequent calls to norm/denorm.
         # Call set_scaler() to reset
         if not self.scaler_fitted:
-            self.fit_scaler(df)
+            if (ctx is not None) and (ctx['cols'] == tuple(cols)):
+                sorted_window = self.update_scaler(df, ctx, inputs)
+            else:
+                self.fit_scaler(df)
 
+        data = df
         df = pd.DataFrame(self.scaler.transform(df), columns=cols)
 
+        if inputs is not None:
+            self.save_norm_context(key, dataframe.columns, inputs, data, df, sorted_window)
+
         return df
 
 
+    # save the normalisation context for key. Only the Robust scaler needs the (sorted) data, to update the quantiles.
+    # The sorted data window is only available if the scaler was updated, otherwise it is created when needed
+    def save_norm_context(self, key, in_cols, inputs, data, df_norm, sorted_window=None):
+        ctx = {
+            'type': self.scaler_type,
+            'in_cols': tuple(in_cols),
+            'cols': tuple(df_norm.columns),
+            'inputs': inputs,
+            'scaler': self.scaler,
+            'df_norm': df_norm.copy(),
+            'data': None,
+            'sorted': None
+        }
+
+        if self.scaler_type == ScalerType.Robust:
+            ctx['data'] = data.to_numpy(dtype=float)
+            ctx['sorted'] = sorted_window
+
+        self.norm_cache[key] = ctx
+        return
+
+    # get a fingerprint of the inputs to norm_dataframe(), so that they can be checked cheaply: the dates and a hash
+    # of each row of numeric data (rather than a copy of the data)
+    def get_norm_inputs(self, dataframe: DataFrame):
+        values = dataframe.select_dtypes(include=['number', 'bool']).to_numpy(dtype=float)
+        dates = None
+        if 'date' in dataframe.columns:
+            dates = dataframe['date']
+            if not pd.api.types.is_datetime64_any_dtype(dates):
+                dates = pd.to_datetime(dates, utc=True)
+            dates = dates.values.astype('int64')
+        return {'rows': self.get_row_hashes(values), 'dates': dates}
+
+    # 64-bit hash of the (raw bits of the) values in each row
+    def get_row_hashes(self, values: np.array) -> np.array:
+        values = np.where(np.isnan(values), np.nan, values)  # all NaNs hash the same
+        bits = np.ascontiguousarray(values).view(np.uint64)
+        weights = np.random.default_rng(12345).integers(1, 2**63, size=np.shape(bits)[1], dtype=np.uint64) | 1
+        return ((bits ^ (bits >> np.uint64(29))) * weights).sum(axis=1, dtype=np.uint64)
+
+    def same_norm_inputs(self, prev_inputs, inputs):
+        if (prev_inputs['dates'] is None) != (inputs['dates'] is None):
+            return False
+        if (inputs['dates'] is not None) and (not np.array_equal(prev_inputs['dates'], inputs['dates'])):
+            return False
+        return np.array_equal(prev_inputs['rows'], inputs['rows'])
+
+    # re-fit the scaler to df, using the context from a previous call.
+    # Standard/MinMax statistics are cheap reductions over the data, so they are just calculated directly and copied
+    # into the previous (fitted) scaler. For Robust, the sorted data window is updated with the rows that were
+    # dropped/added since the last call, and the quantiles are read from that. Falls back to a full fit otherwise.
+    # Returns the updated sorted data window (Robust only, None otherwise)
+    def update_scaler(self, df: DataFrame, ctx, inputs):
+        data = df.to_numpy(dtype=float)
+        scaler = copy.copy(ctx['scaler'])
+        sorted_window = None
+
+        if not np.isfinite(data).all():
+            self.fit_scaler(df)
+            return sorted_window
+
+        if self.scaler_type == ScalerType.Standard:
+            scaler.mean_ = np.mean(data, axis=0)
+            scaler.var_ = np.var(data, axis=0)
+            scaler.scale_ = self.handle_zeros_in_scale(np.sqrt(scaler.var_))
+            scaler.n_samples_seen_ = np.shape(data)[0]
+
+        elif self.scaler_type == ScalerType.MinMax:
+            data_min = np.min(data, axis=0)
+            data_max = np.max(data, axis=0)
+            feature_range = scaler.feature_range
+            scaler.data_min_ = data_min
+            scaler.data_max_ = data_max
+            scaler.data_range_ = data_max - data_min
+            scaler.scale_ = (feature_range[1] - feature_range[0]) / self.handle_zeros_in_scale(scaler.data_range_)
+            scaler.min_ = feature_range[0] - data_min * scaler.scale_
+            scaler.n_samples_seen_ = np.shape(data)[0]
+
+        elif self.scaler_type == ScalerType.Robust:
+            sorted_window = self.update_sorted_window(ctx, data, inputs)
+            if sorted_window is None:
+                self.fit_scaler(df)
+                return sorted_window
+            q_min, q_max = scaler.quantile_range
+            if scaler.with_centering:
+                scaler.center_ = self.get_sorted_quantile(sorted_window, 50.0)
+            if scaler.with_scaling:
+                scale = self.get_sorted_quantile(sorted_window, q_max) - self.get_sorted_quantile(sorted_window, q_min)
+                scaler.scale_ = self.handle_zeros_in_scale(scale)
+
+        else:
+            self.fit_scaler(df)
+            return sorted_window
+
+        self.scaler = scaler
+        self.scaler_fitted = True
+        return sorted_window
+
+    # update the sorted data window from ctx with the rows dropped/added since then.
+    # Returns None if the data is not a sliding window of the previous data (or too much has changed)
+    def update_sorted_window(self, ctx, data, inputs):
+        prev_inputs = ctx['inputs']
+        prev_dates = prev_inputs['dates']
+        dates = inputs['dates']
+        if (ctx['data'] is None) or (dates is None) or (prev_dates is None) or (len(dates) == 0):
+            return None
+        if not np.isfinite(ctx['data']).all():
+            return None
+
+        # find the no. of rows dropped from the start of the previous data, and check that the rest is unchanged
+        matches = np.flatnonzero(prev_dates == dates[0])
+        if len(matches) == 0:
+            return None
+        ndrop = matches[0]
+        nkeep = len(prev_dates) - ndrop
+        nadd = len(dates) - nkeep
+
+        # beyond this, re-sorting is faster
+        if (nadd < 0) or ((ndrop + nadd) > max(1, len(dates) // 16)):
+            return None
+
+        if not (np.array_equal(prev_dates[ndrop:], dates[:nkeep]) and
+                np.array_equal(prev_inputs['rows'][ndrop:], inputs['rows'][:nkeep])):
+            return None
+
+        sorted_window = ctx['sorted']
+        if sorted_window is None:
+            sorted_window = np.sort(ctx['data'], axis=0)
+
+        for row in ctx['data'][:ndrop]:
+            sorted_window = self.remove_sorted_row(sorted_window, row)
+        for row in data[nkeep:]:
+            sorted_window = self.insert_sorted_row(sorted_window, row)
+
+        return sorted_window
+
+    # remove a row of values from a (column-wise) sorted array
+    def remove_sorted_row(self, sorted_window, row):
+        pos = (sorted_window < row).sum(axis=0)
+        r = np.arange(np.shape(sorted_window)[0] - 1)[:, None]
+        return np.where(r < pos, sorted_window[:-1], sorted_window[1:])
+
+    # insert a row of values into a (column-wise) sorted array
+    def insert_sorted_row(self, sorted_window, row):
+        pos = (sorted_window < row).sum(axis=0)
+        r = np.arange(np.shape(sorted_window)[0] + 1)[:, None]
+        below = np.concatenate([sorted_window, sorted_window[-1:]])
+        above = np.concatenate([sorted_window[:1], sorted_window])
+        return np.where(r < pos, below, np.where(r == pos, row, above))
+
+    # get a quantile (in percent) of each column of a sorted array (linear interpolation, same as np.percentile)
+    def get_sorted_quantile(self, sorted_window, q):
+        nrows = np.shape(sorted_window)[0]
+        h = (nrows - 1) * q / 100.0
+        lo = int(np.floor(h))
+        hi = min(lo + 1, nrows - 1)
+        frac = h - lo
+        return sorted_window[lo] + frac * (sorted_window[hi] - sorted_window[lo])
+
+    # set scales of (near) constant features to 1 (same as sklearn)
+    def handle_zeros_in_scale(self, scale):
+        scale = np.array(scale, dtype=float)
+        scale[scale < 10 * np.finfo(scale.dtype).eps] = 1.0
+        return scale
+
+
     # De-Normalise a dataframe - note this relies on the scaler still being valid
     def denorm_dataframe(self, dataframe: DataFrame) -> DataFrame:
 
@@ -467,47 +674,87 @@ class DataframeUtils():
         return train_tensor, test_tensor, train_buys_tensor, test_buys_tensor, train_sells_tensor, test_sells_tensor
 
     # convert dataframe to 3D tensor (for use with keras models)
-    def df_to_tensor(self, df, seq_len):
+    # Row i of the result holds rows i, i-1, ..., i-seq_len+1 of the data (zero-filled before the start).
+    # The tensor is built as a strided view over a zero-padded copy of the data, so no per-row copying is done.
+    # as_view=True returns the (read-only) view instead of a materialised copy, dtype sets the output type
+    # (e.g. np.float32 to halve memory usage)
+    def df_to_tensor(self, df, seq_len, as_view=False, dtype=float):
 
         if self.is_dataframe(df):
-            data = np.array(df)
+            data = np.array(df, dtype=dtype)
         else:
-            data = df
+            data = np.asarray(df, dtype=dtype)
 
         nrows = np.shape(data)[0]
         nfeatures = np.shape(data)[1]
-        tensor_arr = np.zeros((nrows, seq_len, nfeatures), dtype=float)
-        zero_row = np.zeros((nfeatures), dtype=float)
-        # tensor_arr = []
 
-        # print("data:{} tensor:{}".format(np.shape(data), np.shape(tensor_arr)))
-        # print("nrows:{} nfeatures:{}".format(nrows, nfeatures))
+        # pad the front with zeros so that the first seq_len rows are (sparsely) populated
+        padded = np.zeros((nrows + seq_len - 1, nfeatures), dtype=dtype)
+        padded[seq_len - 1:] = data
 
-        reverse = True
+        # windows: (nrows, nfeatures, seq_len) -> (nrows, seq_len, nfeatures), most recent row first
+        windows = np.lib.stride_tricks.sliding_window_view(padded, seq_len, axis=0)
+        tensor_arr = windows.transpose(0, 2, 1)[:, ::-1, :]
+
+        if not as_view:
+            tensor_arr = np.array(tensor_arr, copy=True)  # always a (writeable) copy, even if seq_len == 1
 
-        # fill the first part (0..seqlen rows), which are only sparsely populated
-        for row in range(seq_len):
-            for seq in range(seq_len):
-                if seq >= (seq_len - row - 1):
-                    src_row = (row + seq) - seq_len + 1
-                    tensor_arr[row][seq] = data[src_row]
-                else:
-                    tensor_arr[row][seq] = zero_row
-            if reverse:
-                tensor_arr[row] = np.flipud(tensor_arr[row])
-
-        # fill the rest
-        # print("Data:{}, len:{}".format(np.shape(data), seq_len))
-        for row in range(seq_len, nrows):
-            tensor_arr[row] = data[(row - seq_len) + 1:row + 1]
-            if reverse:
-                tensor_arr[row] = np.flipud(tensor_arr[row])
-
-        # print("data: ", data)
-        # print("tensor: ", tensor_arr)
         # print("data:{} tensor:{}".format(np.shape(data), np.shape(tensor_arr)))
         return tensor_arr
 
+    #################################
+    # compression (PCA) utilities
+
+    pca_cache = None  # fitted PCA compressors, keyed by pair
+
+    # get a (whitened) PCA compressor for the supplied data. A single full SVD is done, and the result is then truncated
+    # to the number of components needed (fixed, or enough to reach variance_threshold), rather than fitting again.
+    # If a key (e.g. pair) is supplied, the result is cached and re-used as long as the columns and data are the same
+    def get_pca_compressor(self, df_norm, n_components=0, variance_threshold=0.0, whiten=True, key=""):
+
+        if self.pca_cache is None:
+            self.pca_cache = {}
+
+        data = np.ascontiguousarray(df_norm, dtype=float)
+        columns = tuple(df_norm.columns) if self.is_dataframe(df_norm) else np.shape(data)[1]
+        signature = (columns, n_components, variance_threshold, whiten,
+                     np.shape(data), hashlib.md5(data.tobytes()).hexdigest())
+
+        if key and (key in self.pca_cache) and (self.pca_cache[key][0] == signature):
+            return self.pca_cache[key][1]
+
+        compressor = skd.PCA(n_components=None, whiten=whiten, svd_solver='full').fit(df_norm)
+
+        # select no. of components
+        max_components = len(compressor.explained_variance_ratio_)
+        if n_components > 0:
+            ncols = min(n_components, max_components)
+        elif variance_threshold > 0.0:
+            var_sum = np.cumsum(compressor.explained_variance_ratio_)
+            ncols = min(int(np.searchsorted(var_sum, variance_threshold)) + 1, max_components)
+        else:
+            ncols = max_components
+
+        self.truncate_pca(compressor, ncols)
+
+        if key:
+            self.pca_cache[key] = (signature, compressor)
+
+        return compressor
+
+    # truncate a fitted PCA to the first ncols components. Equivalent to fitting with n_components=ncols (full solver)
+    def truncate_pca(self, pca, ncols):
+        ev = pca.explained_variance_
+        if ncols < len(ev):
+            pca.noise_variance_ = ev[ncols:].mean() if ncols < min(pca.n_samples_, pca.n_features_in_) else 0.0
+        pca.components_ = pca.components_[:ncols]
+        pca.explained_variance_ = ev[:ncols]
+        pca.explained_variance_ratio_ = pca.explained_variance_ratio_[:ncols]
+        pca.singular_values_ = pca.singular_values_[:ncols]
+        pca.n_components_ = ncols
+        pca.n_components = ncols
+        return pca
+
     # utility to check whether an object is a Dataframe
     def is_dataframe(self, data) -> bool:
         ctype = str(type(data)).lower()
@@ -1,4 +1,5 @@
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 import scipy.fft
 from scipy.fft import rfft, irfft
 import talib.abstract as ta
@@ -20,6 +21,7 @@ import pandas as pd
 pd.options.mode.chained_assignment = None  # default='warn'
 
 # Strategy specific imports, files must reside in same folder as strategy
+import os
 import sys
 from pathlib import Path
 
@@ -92,6 +94,9 @@ class FBB_KalmanSIMD(IStrategy):
 
     current_pair = ""
 
+    batch_size = 4096  # max number of windows smoothed in a single call
+    cache_filter_params = True  # if True, EM-fitted filter parameters are saved per pair (in models/)
+
     ###################################
 
     # Strategy Specific Variable Storage
@@ -174,20 +179,24 @@ class FBB_KalmanSIMD(IStrategy):
 
         self.current_pair = curr_pair
 
-        # create if not already done
+        # create if not already done (re-uses fitted parameters from previous runs, if available)
         if not curr_pair in self.filter_list:
-            self.filter_list[curr_pair] = kalman_filter = KalmanFilter(
-                state_transition=1.0,
-                process_noise=2.0,
-                observation_model=1.0,
-                observation_noise=0.5
-            )
-            self.filter_init_list[curr_pair] = False
+            kalman_filter = self.load_filter(curr_pair)
+            self.filter_init_list[curr_pair] = kalman_filter is not None
+            if kalman_filter is None:
+                kalman_filter = KalmanFilter(
+                    state_transition=1.0,
+                    process_noise=2.0,
+                    observation_model=1.0,
+                    observation_noise=0.5
+                )
+            self.filter_list[curr_pair] = kalman_filter
 
-        # set current filter (can't pass parameter to apply())
+        # set current filter
         self.kalman_filter = self.filter_list[curr_pair]
 
-        informative['kf_model'] = informative['close'].rolling(window=self.kf_window).apply(self.model)
+        # informative['kf_model'] = informative['close'].rolling(window=self.kf_window).apply(self.model)
+        informative['kf_model'] = self.rolling_model(informative['close'].to_numpy(dtype=float), self.kalman_filter)
         # informative['kf_predict'] = informative['kf_model'].rolling(window=self.kf_window).apply(self.predict)
         # informative['stddev'] = informative['close'].rolling(window=self.kf_window).std()
 
@@ -258,6 +267,81 @@ class FBB_KalmanSIMD(IStrategy):
         """ Mean absolute deviation of a signal """
         return np.mean(np.absolute(d - np.mean(d, axis)), axis)
 
+    # batched version of rolling(window=self.kf_window).apply(self.model)
+    # All windows are standardised together, and smoothed in a few large batches (simdkalman processes
+    # multiple series in parallel), rather than one call per window
+    def rolling_model(self, data: np.ndarray, kfilter: KalmanFilter) -> np.ndarray:
+        model = np.full(len(data), np.nan)
+        if len(data) < self.kf_window:
+            return model
+
+        # windows with NaNs are skipped (same as rolling())
+        windows = sliding_window_view(data, self.kf_window)
+        valid = ~np.isnan(windows).any(axis=1)
+        windows = windows[valid]
+        if len(windows) == 0:
+            return model
+
+        # scale the data
+        w_mean = np.mean(windows, axis=1, keepdims=True)
+        w_std = np.std(windows, axis=1, keepdims=True)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scaled = np.where(w_std > 0.0, (windows - w_mean) / w_std, 0.0)
+
+        # init filter if needed (fitted on the first window, used from the next call onwards)
+        if not self.filter_init_list[self.current_pair]:
+            self.filter_init_list[self.current_pair] = True
+            self.filter_list[self.current_pair] = self.filter_list[self.current_pair].em(scaled[0], n_iter=6)
+            self.save_filter(self.current_pair, self.filter_list[self.current_pair])
+
+        # get the Kalman model (last value of each window)
+        restored_sig = np.zeros(len(scaled))
+        for start in range(0, len(scaled), self.batch_size):
+            batch = scaled[start:start + self.batch_size]
+            smoothed = kfilter.smooth(batch)
+            restored_sig[start:start + len(batch)] = np.reshape(smoothed.observations.mean, (len(batch), -1))[:, -1]
+
+        # re-trend
+        model[self.kf_window - 1:][valid] = (restored_sig * w_std[:, 0]) + w_mean[:, 0]
+
+        return model
+
+    # path of the saved filter parameters for a pair
+    def get_filter_path(self, pair: str) -> str:
+        root_dir = str(Path(__file__).parent) + "/models/" + self.__class__.__name__
+        return root_dir + "/" + pair.replace("/", "_").replace(":", "_") + "_kf.npz"
+
+    def save_filter(self, pair: str, kfilter: KalmanFilter):
+        if not self.cache_filter_params:
+            return
+        path = self.get_filter_path(pair)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            np.savez(path,
+                     state_transition=kfilter.state_transition,
+                     process_noise=kfilter.process_noise,
+                     observation_model=kfilter.observation_model,
+                     observation_noise=kfilter.observation_noise)
+        except OSError as e:
+            print(f"    Error saving filter parameters for {pair}: {e}")
+
+    # returns None if there are no saved parameters for the pair
+    def load_filter(self, pair: str):
+        path = self.get_filter_path(pair)
+        if (not self.cache_filter_params) or (not os.path.exists(path)):
+            return None
+        try:
+            params = np.load(path)
+            return KalmanFilter(
+                state_transition=params['state_transition'],
+                process_noise=params['process_noise'],
+                observation_model=params['observation_model'],
+                observation_noise=params['observation_noise']
+            )
+        except (OSError, KeyError, ValueError) as e:
+            print(f"    Error loading filter parameters for {pair}: {e}")
+            return None
+
     def model(self, a: np.ndarray) -> float:
         # scale the data
         standardized = a.copy()
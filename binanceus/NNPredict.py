@@ -49,7 +49,6 @@ import tensorflow as tf
 from keras import layers
 from tqdm import tqdm
 from tqdm.keras import TqdmCallback
-import sklearn.decomposition as skd
 
 import random
 import Time2Vector
@@ -275,6 +274,8 @@ class NNPredict(IStrategy):
 
         if self.dataframeUtils is None:
             self.dataframeUtils = DataframeUtils()
+            # normalisation results are only re-used in dry_run/live, where the same pairs are processed every candle
+            self.dataframeUtils.cache_norm_data = self.dp.runmode.value in ('dry_run', 'live')
 
         if self.dataframePopulator is None:
 
@@ -418,7 +419,7 @@ class NNPredict(IStrategy):
                 self.curr_classifier = self.make_classifier(self.curr_pair, self.seq_len, nfeatures)
 
         if self.curr_classifier.prescale_data():
-            df_norm = self.dataframeUtils.norm_dataframe(dataframe)
+            df_norm = self.dataframeUtils.norm_dataframe(dataframe, key=self.curr_pair)
         else:
             df_norm = dataframe.copy()
 
@@ -565,7 +566,7 @@ class NNPredict(IStrategy):
         # pre-scale if needed
         if prescale_data:
             price_scaler.fit(dataframe[self.target_column].to_numpy().reshape(1, -1))
-            df_norm = self.dataframeUtils.norm_dataframe(dataframe)
+            df_norm = self.dataframeUtils.norm_dataframe(dataframe, key=self.curr_pair)
         else:
             df_norm = dataframe
 
@@ -617,7 +618,7 @@ class NNPredict(IStrategy):
 
         # pre-scale if needed
         if prescale_data:
-            df_norm = self.dataframeUtils.norm_dataframe(dataframe)
+            df_norm = self.dataframeUtils.norm_dataframe(dataframe, key=self.curr_pair)
         else:
             df_norm = dataframe
 
@@ -715,7 +716,7 @@ class NNPredict(IStrategy):
 
         # pre-scale if needed
         if prescale_data:
-            df_norm = self.dataframeUtils.norm_dataframe(dataframe)
+            df_norm = self.dataframeUtils.norm_dataframe(dataframe, key=self.curr_pair)
         else:
             df_norm = dataframe
 
@@ -802,7 +803,7 @@ class NNPredict(IStrategy):
 
         # pre-scale if needed
         if prescale_data:
-            df_norm = self.dataframeUtils.norm_dataframe(dataframe)
+            df_norm = self.dataframeUtils.norm_dataframe(dataframe, key=self.curr_pair)
         else:
             df_norm = dataframe
 
@@ -890,7 +891,7 @@ class NNPredict(IStrategy):
     def get_compressor(self, df_norm: DataFrame):
         # just use fixed size PCA (easier for classifiers to deal with)
         ncols = int(64)
-        compressor = skd.PCA(n_components=ncols, whiten=True, svd_solver='full').fit(df_norm)
+        compressor = self.dataframeUtils.get_pca_compressor(df_norm, n_components=ncols, whiten=True, key=self.curr_pair)
         return compressor
 
     # compress the supplied dataframe
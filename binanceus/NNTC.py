@@ -38,7 +38,6 @@ logging.disable(logging.WARNING)
 import custom_indicators as cta
 
 from sklearn.metrics import classification_report
-import sklearn.decomposition as skd
 
 from sklearn.metrics import make_scorer
 from sklearn.metrics import accuracy_score
@@ -363,6 +362,8 @@ class NNTC(IStrategy):
         # create and initialise instances of objects shared across pairs
         if self.dataframeUtils is None:
             self.dataframeUtils = DataframeUtils()
+            # normalisation results are only re-used in dry_run/live, where the same pairs are processed every candle
+            self.dataframeUtils.cache_norm_data = self.dp.runmode.value in ('dry_run', 'live')
 
         if self.dataframePopulator is None:
 
@@ -476,7 +477,7 @@ class NNTC(IStrategy):
 
         # future_df = self.add_future_data(dataframe.copy())
         future_df = self.dataframePopulator.add_hidden_indicators(dataframe.copy())
-        future_df = self.dataframePopulator.add_future_data(future_df, self.curr_lookahead)
+        future_df = self.dataframePopulator.add_future_data(future_df, self.curr_lookahead, pair=self.curr_pair)
 
         future_df['train_buy'] = 0.0
         future_df['train_sell'] = 0.0
@@ -588,11 +589,11 @@ class NNTC(IStrategy):
         remove_outliers = False
         if remove_outliers:
             # norm dataframe before splitting, otherwise variances are skewed
-            full_df_norm = self.dataframeUtils.norm_dataframe(dataframe)
+            full_df_norm = self.dataframeUtils.norm_dataframe(dataframe, key=self.curr_pair)
             full_df_norm, buys, sells = self.dataframeUtils.remove_outliers(full_df_norm, buys, sells)
         else:
-            # full_df_norm = self.dataframeUtils.norm_dataframe(dataframe).clip(lower=-3.0, upper=3.0)  # supress outliers
-            full_df_norm = self.dataframeUtils.norm_dataframe(dataframe)
+            # full_df_norm = self.dataframeUtils.norm_dataframe(dataframe, key=self.curr_pair).clip(lower=-3.0, upper=3.0)  # supress outliers
+            full_df_norm = self.dataframeUtils.norm_dataframe(dataframe, key=self.curr_pair)
 
         # compress data
         if self.compress_data:
@@ -747,7 +748,7 @@ class NNTC(IStrategy):
     def get_compressor(self, df_norm: DataFrame):
         #  use fixed size PCA (Tensorflow models need fixed inputs)
         ncols = min(self.COMPRESSED_SIZE, df_norm.shape[-1])
-        compressor = skd.PCA(n_components=ncols, whiten=True, svd_solver='full').fit(df_norm)
+        compressor = self.dataframeUtils.get_pca_compressor(df_norm, n_components=ncols, whiten=True, key=self.curr_pair)
 
         num_features = np.shape(df_norm)[-1]
         if num_features > 2.0 * ncols:
@@ -936,7 +937,7 @@ class NNTC(IStrategy):
 
         if clf is not None:
             # print("    predicting... - dataframe:", dataframe.shape)
-            df_norm = self.dataframeUtils.norm_dataframe(dataframe)
+            df_norm = self.dataframeUtils.norm_dataframe(dataframe, key=self.curr_pair)
             if self.compress_data:
                 df_norm = self.compress_dataframe(df_norm)
 
@@ -76,6 +76,7 @@ from sklearn.metrics import f1_score
 from sklearn.model_selection import cross_validate
 
 import random
+import hashlib
 
 from prettytable import PrettyTable
 
@@ -85,6 +86,7 @@ from RBMEncoder import RBMEncoder
 
 from DataframeUtils import DataframeUtils, ScalerType
 from DataframePopulator import DataframePopulator
+import ClassifierTournament
 
 """
 ####################################################################################
@@ -210,6 +212,12 @@ class PCA(IStrategy):
     pair_model_info = {}  # holds model-related info for each pair
     classifier_stats = {}  # holds statistics for each type of classifier (useful to rank classifiers
 
+    # classifier tournament (used by find_best_classifier)
+    tournament_workers = 4  # no. of processes used to fit candidates. Set to 1 to fit serially
+    tournament_time_budget = 0.0  # max. seconds per candidate fit (0 = no limit). Over-budget candidates are eliminated
+    tournament_min_fraction = 1.0  # fraction of training data in first round. <1.0 enables successive halving
+    tournament_cache = {}  # holds the latest tournament result for each (pair, tag), with the hash of the data used
+
     ignore_exit_signals = False # set to True if you don't want to process sell/exit signals (let custom sell do it)
 
     # debug flags
@@ -445,7 +453,7 @@ class PCA(IStrategy):
     def create_training_data(self, dataframe: DataFrame):
 
         future_df = self.dataframePopulator.add_hidden_indicators(dataframe.copy())
-        future_df = self.dataframePopulator.add_future_data(future_df, self.curr_lookahead)
+        future_df = self.dataframePopulator.add_future_data(future_df, self.curr_lookahead, pair=self.curr_pair)
 
         future_df['train_buy'] = 0.0
         future_df['train_sell'] = 0.0
@@ -657,25 +665,12 @@ class PCA(IStrategy):
 
         # there are various types of PCA, plus alternatives like ICA and Feature Extraction
         if pca_type == 0:
-            pca = skd.PCA(n_components=ncols, whiten=whiten, svd_solver='full').fit(df_norm)
-            var_ratios = pca.explained_variance_ratio_
-
-            # if self.dbg_verbose:
-            #     print ("PCA variance_ratio: ", pca.explained_variance_ratio_)
-
-            # scan variance and only take if column contributes >x%
-            ncols = 0
-            var_sum = 0.0
+            # only take as many columns as needed to reach the variance threshold. This is done with a single SVD, and
+            # the result is cached per pair (as long as the data doesn't change)
             variance_threshold = 0.999
             # variance_threshold = 0.99
-            while ((var_sum < variance_threshold) & (ncols < len(var_ratios))):
-                var_sum = var_sum + var_ratios[ncols]
-                ncols = ncols + 1
-
-            # if necessary, re-calculate pca with reduced column set
-            if (ncols != df_norm.shape[1]):
-                # pca = skd.PCA(n_components=ncols, svd_solver="randomized", whiten=True).fit(df_norm)
-                pca = skd.PCA(n_components=ncols, whiten=whiten, svd_solver='full').fit(df_norm)
+            pca = self.dataframeUtils.get_pca_compressor(df_norm, variance_threshold=variance_threshold, whiten=whiten,
+                                                         key=self.curr_pair)
 
             self.check_pca(pca, df_norm)
 
@@ -999,53 +994,58 @@ class PCA(IStrategy):
             print("    Insufficient +ve (test) results: ", res_test.sum())
             return None, ""
 
+        # if the same data has already been evaluated, just re-use the result
+        data_hash = hashlib.md5(np.ascontiguousarray(df, dtype=float).tobytes() +
+                                np.ascontiguousarray(labels).tobytes()).hexdigest()
+        cache_key = (self.curr_pair, tag)
+        if (cache_key in self.tournament_cache) and (self.tournament_cache[cache_key][0] == data_hash):
+            _, clf, best_classifier, best_score = self.tournament_cache[cache_key]
+            if self.dbg_verbose:
+                print("      Re-using previous result: {0:<20}: {1:.3f}".format(best_classifier, best_score))
+            return clf, best_classifier
+
+        candidates = {}
         for cname in self.classifier_list:
             clf, _ = self.classifier_factory(cname, df_train, res_train)
-
             if clf is not None:
+                candidates[cname] = clf
 
-                # fit to the training data
-                clf_dict[cname] = clf
-                clf = clf.fit(df_train, res_train)
+        # fit the candidates, eliminating the worst performers on progressively larger subsets of the training data
+        best_classifier, clf, best_score, scores = ClassifierTournament.run_tournament(
+            candidates, df_train, res_train, df_test, res_test,
+            num_workers=self.tournament_workers, time_budget=self.tournament_time_budget,
+            min_fraction=self.tournament_min_fraction,
+            verbose=self.dbg_verbose)
 
-                # assess using the test data. Do *not* use the training data for testing
-                pred_test = clf.predict(df_test)
-                # score = f1_score(results, prediction, average=None)[1]
-                score = f1_score(res_test, pred_test, average='macro')
+        for cname, score in scores.items():
 
-                if self.dbg_verbose:
-                    print("      {0:<20}: {1:.3f}".format(cname, score))
-
-                if score > best_score:
-                    best_score = score
-                    best_classifier = cname
-
-                # update classifier stats
-                if tag:
-                    if not (tag in self.classifier_stats):
-                        self.classifier_stats[tag] = {}
+            # update classifier stats
+            if tag:
+                if not (tag in self.classifier_stats):
+                    self.classifier_stats[tag] = {}
 
-                    if not (cname in self.classifier_stats[tag]):
-                        self.classifier_stats[tag][cname] = {'count': 0, 'score': 0.0, 'selected': 0}
+                if not (cname in self.classifier_stats[tag]):
+                    self.classifier_stats[tag][cname] = {'count': 0, 'score': 0.0, 'selected': 0}
 
-                    curr_count = self.classifier_stats[tag][cname]['count']
-                    curr_score = self.classifier_stats[tag][cname]['score']
-                    self.classifier_stats[tag][cname]['count'] = curr_count + 1
-                    self.classifier_stats[tag][cname]['score'] = (curr_score * curr_count + score) / (curr_count + 1)
+                curr_count = self.classifier_stats[tag][cname]['count']
+                curr_score = self.classifier_stats[tag][cname]['score']
+                self.classifier_stats[tag][cname]['count'] = curr_count + 1
+                self.classifier_stats[tag][cname]['score'] = (curr_score * curr_count + score) / (curr_count + 1)
 
         if best_score <= 0.0:
             print("   No classifier found")
             return None, ""
 
-        clf = clf_dict[best_classifier]
-
         # print("")
         if best_score < self.min_f1_score:
             print("!!!")
             print("!!! WARNING: F1 score below threshold ({:.3f})".format(best_score))
             print("!!!")
+            self.tournament_cache[cache_key] = (data_hash, None, "", best_score)
             return None, ""
 
+        self.tournament_cache[cache_key] = (data_hash, clf, best_classifier, best_score)
+
         # update stats for selected classifier
         if tag:
             if best_classifier in self.classifier_stats[tag]:
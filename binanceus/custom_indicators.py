@@ -2,6 +2,7 @@
 Solipsis Custom Indicators and Maths
 """
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 import talib.abstract as ta
 import freqtrade.vendor.qtpylib.indicators as qtpylib
 
@@ -35,6 +36,31 @@ def linear_decay(start: float, end: float, start_time: int, end_time: int, trade
 
     return max(end, start - (rate * time))
 
+def rolling_slope(series, window: int):
+    """
+    Rolling linear slope. Same as series.rolling(window).apply(slope of np.polyfit(index, col, 1)) for a unit-spaced
+    index, but uses the closed form slope = sum((x - mean(x)) * y) / sum((x - mean(x))^2) over strided windows.
+    Windows containing NaN/inf return NaN (as rolling() does), any other nan/inf slope is replaced with 10.0
+    """
+    y = np.asarray(series, dtype=float)
+    slope = np.full(len(y), np.nan)
+    if len(y) < window:
+        return slope
+
+    x = np.arange(window) - (window - 1) / 2.0
+    windows = sliding_window_view(y, window)
+
+    with np.errstate(invalid='ignore', over='ignore'):
+        s = windows @ x / np.sum(x * x)
+
+    # match rolling(): incomplete windows are NaN, otherwise substitute nan/inf
+    has_nan = ~np.isfinite(windows).all(axis=1)
+    s = np.where(np.isfinite(s), s, 10.0)
+    s[has_nan] = np.nan
+
+    slope[window-1:] = s
+    return slope
+
 """
 TA Indicators
 """
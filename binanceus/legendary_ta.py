@@ -237,47 +237,17 @@ def exhaustion_bars(dataframe, maj_qual=6, maj_len=12, min_qual=6, min_len=12, c
     :return: DataFrame with columns populated
     """
 
-    bindex_maj, sindex_maj, trend_maj = 0, 0, 0
-    bindex_min, sindex_min = 0, 0
-
-    for i in range(len(dataframe)):
-        close = dataframe['close'][i]
-
-        if i < 1 or i - core_length < 0:
-            dataframe.loc[i, 'leledc_major'] = np.nan
-            dataframe.loc[i, 'leledc_minor'] = 0
-            continue
-
-        bindex_maj, sindex_maj = np.nan_to_num(bindex_maj), np.nan_to_num(sindex_maj)
-        bindex_min, sindex_min = np.nan_to_num(bindex_min), np.nan_to_num(sindex_min)
-
-        if close > dataframe['close'][i - core_length]:
-            bindex_maj += 1
-            bindex_min += 1
-        elif close < dataframe['close'][i - core_length]:
-            sindex_maj += 1
-            sindex_min += 1
+    close = dataframe['close'].to_numpy(dtype=float)
+    prev_close = np.full(len(close), np.nan)
+    if core_length < len(close):
+        prev_close[core_length:] = close[:len(close) - core_length]
 
-        update_major = False
-        if bindex_maj > maj_qual and close < dataframe['open'][i] and dataframe['high'][i] >= dataframe['high'][
-                                                                                              i - maj_len:i].max():
-            bindex_maj, trend_maj, update_major = 0, 1, True
-        elif sindex_maj > maj_qual and close > dataframe['open'][i] and dataframe['low'][i] <= dataframe['low'][
-                                                                                               i - maj_len:i].min():
-            sindex_maj, trend_maj, update_major = 0, -1, True
+    # first candles have no history
+    major, minor = leledc_major_minor(dataframe, prev_close, maj_qual, min_qual, maj_len, min_len,
+                                      start=max(1, core_length))
 
-        dataframe.loc[i, 'leledc_major'] = trend_maj if update_major else np.nan if trend_maj == 0 else trend_maj
-
-        if bindex_min > min_qual and close < dataframe['open'][i] and dataframe['high'][i] >= dataframe['high'][
-                                                                                              i - min_len:i].max():
-            bindex_min = 0
-            dataframe.loc[i, 'leledc_minor'] = -1
-        elif sindex_min > min_qual and close > dataframe['open'][i] and dataframe['low'][i] <= dataframe['low'][
-                                                                                               i - min_len:i].min():
-            sindex_min = 0
-            dataframe.loc[i, 'leledc_minor'] = 1
-        else:
-            dataframe.loc[i, 'leledc_minor'] = 0
+    dataframe['leledc_major'] = major
+    dataframe['leledc_minor'] = minor.astype(float)
 
     return dataframe
 
@@ -330,44 +300,82 @@ def dynamic_exhaustion_bars(dataframe, window=500):
 
 
 def populate_leledc_major_minor(dataframe, maj_qual, min_qual, maj_len, min_len):
-    bindex_maj, sindex_maj, trend_maj = 0, 0, 0
-    bindex_min, sindex_min = 0, 0
+    close = dataframe['close'].to_numpy(dtype=float)
+    prev_close = np.full(len(close), np.nan)
+    if len(close) > 1:
+        # compare to the close 4 candles ago (or the first candle, if less than that)
+        short_length = np.minimum(np.arange(len(close)), 4)
+        prev_close[1:] = close[np.arange(1, len(close)) - short_length[1:]]
+
+    major, minor = leledc_major_minor(dataframe, prev_close, maj_qual, min_qual, maj_len, min_len)
+
+    dataframe['leledc_major'] = major
+    dataframe['leledc_minor'] = minor
+
+    return dataframe
+
+
+def leledc_major_minor(dataframe, prev_close, maj_qual, min_qual, maj_len, min_len, start=1):
+    """
+    Common Leledc state machine, used by exhaustion_bars() and populate_leledc_major_minor()
+    prev_close is the close that each candle is compared against to count up/down bars.
+    The qualifiers can be scalars or arrays. Rows before start are skipped.
+    Everything except the stateful counters is vectorised
+
+    :return: arrays for leledc_major and leledc_minor
+    """
+
+    close = dataframe['close'].to_numpy(dtype=float)
+    open_ = dataframe['open'].to_numpy(dtype=float)
+    high = dataframe['high'].to_numpy(dtype=float)
+    low = dataframe['low'].to_numpy(dtype=float)
+    nrows = len(close)
+
+    maj_qual = np.broadcast_to(np.asarray(maj_qual, dtype=float), (nrows,))
+    min_qual = np.broadcast_to(np.asarray(min_qual, dtype=float), (nrows,))
 
-    dataframe['leledc_major'] = np.nan
-    dataframe['leledc_minor'] = 0
+    # bar direction (relative to prev_close)
+    up = (close > prev_close).tolist()
+    down = (close < prev_close).tolist()
 
-    for i in range(1, len(dataframe)):
-        close = dataframe['close'][i]
-        short_length = i if i < 4 else 4
+    # exhaustion conditions, excluding the bar counts
+    buy_exhausted_maj = ((close < open_) & (high >= prior_window_max(high, maj_len))).tolist()
+    sell_exhausted_maj = ((close > open_) & (low <= prior_window_min(low, maj_len))).tolist()
+    buy_exhausted_min = ((close < open_) & (high >= prior_window_max(high, min_len))).tolist()
+    sell_exhausted_min = ((close > open_) & (low <= prior_window_min(low, min_len))).tolist()
+    maj_qual = maj_qual.tolist()
+    min_qual = min_qual.tolist()
+
+    major = np.full(nrows, np.nan)
+    minor = np.zeros(nrows, dtype=int)
+
+    bindex_maj, sindex_maj, trend_maj = 0, 0, 0
+    bindex_min, sindex_min = 0, 0
 
-        if close > dataframe['close'][i - short_length]:
+    for i in range(start, nrows):
+        if up[i]:
             bindex_maj += 1
             bindex_min += 1
-        elif close < dataframe['close'][i - short_length]:
+        elif down[i]:
             sindex_maj += 1
             sindex_min += 1
 
-        update_major = False
-        if bindex_maj > maj_qual[i] and close < dataframe['open'][i] and dataframe['high'][i] >= dataframe['high'][
-                                                                                                 i - maj_len:i].max():
-            bindex_maj, trend_maj, update_major = 0, 1, True
-        elif sindex_maj > maj_qual[i] and close > dataframe['open'][i] and dataframe['low'][i] <= dataframe['low'][
-                                                                                                  i - maj_len:i].min():
-            sindex_maj, trend_maj, update_major = 0, -1, True
-
-        dataframe.at[i, 'leledc_major'] = trend_maj if update_major else np.nan if trend_maj == 0 else trend_maj
-        if bindex_min > min_qual[i] and close < dataframe['open'][i] and dataframe['high'][i] >= dataframe['high'][
-                                                                                                 i - min_len:i].max():
+        if bindex_maj > maj_qual[i] and buy_exhausted_maj[i]:
+            bindex_maj, trend_maj = 0, 1
+        elif sindex_maj > maj_qual[i] and sell_exhausted_maj[i]:
+            sindex_maj, trend_maj = 0, -1
+
+        if trend_maj != 0:
+            major[i] = trend_maj
+
+        if bindex_min > min_qual[i] and buy_exhausted_min[i]:
             bindex_min = 0
-            dataframe.at[i, 'leledc_minor'] = -1
-        elif sindex_min > min_qual[i] and close > dataframe['open'][i] and dataframe['low'][i] <= dataframe['low'][
-                                                                                                  i - min_len:i].min():
+            minor[i] = -1
+        elif sindex_min > min_qual[i] and sell_exhausted_min[i]:
             sindex_min = 0
-            dataframe.at[i, 'leledc_minor'] = 1
-        else:
-            dataframe.at[i, 'leledc_minor'] = 0
+            minor[i] = 1
 
-    return dataframe
+    return major, minor
 
 
 def calculate_exhaustion_candles(dataframe, window, multiplier):
@@ -375,17 +383,25 @@ def calculate_exhaustion_candles(dataframe, window, multiplier):
     Calculate the average consecutive length of ups and downs to adjust the exhaustion bands dynamically
     To Do: Apply ML (FreqAI) to make prediction
     """
-    consecutive_diff = np.sign(dataframe['close'].diff())
-    maj_qual = np.zeros(len(dataframe))
-    min_qual = np.zeros(len(dataframe))
-
-    for i in range(len(dataframe)):
-        idx_range = consecutive_diff[i - window + 1:i + 1] if i >= window else consecutive_diff[:i + 1]
-        avg_consecutive = consecutive_count(idx_range)
-        if isinstance(avg_consecutive, np.ndarray):
-            avg_consecutive = avg_consecutive.item()
-        maj_qual[i] = int(avg_consecutive * (3 * multiplier[i])) if not np.isnan(avg_consecutive) else 0
-        min_qual[i] = int(avg_consecutive * (3 * multiplier[i])) if not np.isnan(avg_consecutive) else 0
+    # The average distance between consecutive non-zero diffs in a window is just (last - first) / (count - 1),
+    # so it can be calculated for every window using cumulative sums/extremes (see consecutive_count())
+    consecutive_diff = np.sign(dataframe['close'].diff()).to_numpy()
+    nonzero = (consecutive_diff != 0)  # note: NaN counts as non-zero
+    nrows = len(nonzero)
+    index = np.arange(nrows)
+    start = np.maximum(index - window + 1, 0)
+
+    counts = np.concatenate([[0], np.cumsum(nonzero)])
+    count = counts[index + 1] - counts[start]
+    last = np.maximum.accumulate(np.where(nonzero, index, -1))
+    first = np.minimum.accumulate(np.where(nonzero, index, nrows)[::-1])[::-1]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        avg_consecutive = np.where(count > 1, (last - first[start]) / (count - 1), np.nan)
+        qual = np.where(np.isnan(avg_consecutive), 0.0, np.trunc(avg_consecutive * (3 * np.asarray(multiplier))))
+
+    maj_qual = qual.astype(float)
+    min_qual = qual.copy()
 
     return maj_qual, min_qual
 
@@ -446,6 +462,37 @@ def consecutive_count(consecutive_diff):
     return np.mean(np.abs(np.diff(np.where(consecutive_diff != 0))))
 
 
+def prior_window_max(values, length):
+    """
+    max of values[i - length:i] for each row i (NaNs ignored, NaN if the window is empty)
+    """
+    return prior_window_extreme(values, length, np.fmax)
+
+
+def prior_window_min(values, length):
+    """
+    min of values[i - length:i] for each row i (NaNs ignored, NaN if the window is empty)
+    """
+    return prior_window_extreme(values, length, np.fmin)
+
+
+def prior_window_extreme(values, length, func):
+    nrows = len(values)
+    result = np.full(nrows, np.nan)
+
+    if (length > 0) and (nrows > length):
+        windows = np.lib.stride_tricks.sliding_window_view(values[:-1], length)
+        result[length:] = func.reduce(windows, axis=1)
+
+    # the first rows follow slice semantics (i.e. a negative start wraps around), to match the original loop
+    for i in range(min(length, nrows)):
+        window = values[i - length:i]
+        if len(window) > 0:
+            result[i] = func.reduce(window)
+
+    return result
+
+
 def compare(a, b):
     return a > b
 
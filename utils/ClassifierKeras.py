@@ -58,6 +58,11 @@ class ClassifierKeras():
     prescale_dataframe = True  # set to True if algorithms need dataframes to be pre-scaled
     single_prediction = False  # True if algorithm only produces 1 prediction (not entire data array)
     combine_models = False  # True means combine models for all pairs (unless model per pair). False will train only on 1st pair
+    train_count = 0  # no. of times the model has been trained (used to invalidate streamed predictions)
+
+    stream_predictions = False  # True if predict_stream() can be used (autoencoders only)
+    max_stream_update = 64  # max. no. of new rows handled by predict_stream() before just re-running predict()
+    stream_data = None  # per-key ring buffers of reconstruction errors (see predict_stream())
 
 
     # ---------------------------
@@ -244,8 +249,8 @@ class ClassifierKeras():
                 df_train = df_train_norm.copy()
                 df_test = df_test_norm.copy()
 
-            train_tensor = self.dataframeUtils.df_to_tensor(df_train, self.seq_len)
-            test_tensor = self.dataframeUtils.df_to_tensor(df_test, self.seq_len)
+            train_tensor = self.dataframeUtils.df_to_tensor(df_train, self.seq_len, dtype=np.float32)
+            test_tensor = self.dataframeUtils.df_to_tensor(df_test, self.seq_len, dtype=np.float32)
         else:
             # already in tensor format
             train_tensor = df_train_norm.copy()
@@ -304,6 +309,7 @@ class ClassifierKeras():
 
         self.save()
         self.is_trained = True
+        self.train_count = self.train_count + 1
 
         return
 
@@ -327,7 +333,7 @@ class ClassifierKeras():
         # convert to tensor format and run the autoencoder
         if self.dataframeUtils.is_dataframe(data):
             # convert dataframe to tensor
-            tensor = self.dataframeUtils.df_to_tensor(data, self.seq_len)
+            tensor = self.dataframeUtils.df_to_tensor(data, self.seq_len, dtype=np.float32)
         else:
             tensor = data
 
@@ -369,6 +375,97 @@ class ClassifierKeras():
 
     # ---------------------------
 
+    # get the reconstruction error for each window in the tensor (msle of the most recent row in each window)
+    def get_reconstruction_errors(self, tensor, batch=True):
+        if batch:
+            predict_tensor = self.model.predict(tensor, verbose=0)
+        else:
+            # direct call avoids the (large) fixed overhead of predict() for small inputs
+            predict_tensor = np.asarray(self.model(tensor, training=False))
+
+        if np.shape(predict_tensor)[0] != np.shape(tensor)[0]:
+            print("    ERR: prediction length mismatch ({} vs {})".format(len(predict_tensor), np.shape(tensor)[0]))
+            return None
+
+        msle = np.asarray(keras.losses.msle(predict_tensor, tensor))
+        return msle[:, 0].astype(float)
+
+    # streaming version of predict(), intended for live modes, where only the last row(s) of the data are new.
+    # key identifies the stream (e.g. the pair) and row_ids identify the rows of data (e.g. the dates).
+    # The reconstruction errors for the last len(data) rows are kept in a ring buffer, and the model is only run on
+    # the windows that end in a new row. The threshold statistics (mean + 2 stddev) are updated incrementally.
+    # Note that errors are kept from when they were first calculated, so older rows do not reflect any later
+    # re-normalisation of the data (unlike predict()).
+    # Falls back to a full prediction for new streams, re-trained models, data size changes or large gaps
+    def predict_stream(self, data, key, row_ids):
+
+        # lazy loading because params can change up to this point
+        if self.model is None:
+            # load saved model if present
+            self.model = self.load()
+
+        if self.stream_data is None:
+            self.stream_data = {}
+
+        data = np.asarray(data, dtype=np.float32)
+        row_ids = np.asarray(row_ids)
+        nrows = np.shape(data)[0]
+
+        # work out how many rows are new since the last call
+        stream = self.stream_data.get(key, None)
+        num_new = nrows
+        if (stream is not None) and (stream['model'] is self.model) and \
+                (stream['train_count'] == self.train_count) and (stream['size'] == nrows):
+            matches = np.flatnonzero(row_ids == stream['last_id'])
+            if len(matches) > 0:
+                num_new = nrows - 1 - matches[-1]
+
+        if num_new > min(self.max_stream_update, nrows // 4):
+            # (re-)start the stream
+            tensor = self.dataframeUtils.df_to_tensor(data, self.seq_len, dtype=np.float32)
+            errors = self.get_reconstruction_errors(tensor)
+            if errors is None:
+                self.stream_data.pop(key, None)
+                return np.zeros(nrows, dtype=float)
+
+            stream = {'model': self.model, 'train_count': self.train_count, 'size': nrows, 'errors': errors,
+                      'start': 0, 'sum': np.sum(errors), 'sum_sq': np.sum(np.square(errors)), 'last_id': None}
+
+        elif num_new > 0:
+            # only run the model on the windows ending in the new rows
+            tail = data[-(num_new + self.seq_len - 1):]
+            tensor = self.dataframeUtils.df_to_tensor(tail, self.seq_len, dtype=np.float32)[-num_new:]
+            new_errors = self.get_reconstruction_errors(tensor, batch=False)
+            if new_errors is None:
+                self.stream_data.pop(key, None)
+                return np.zeros(nrows, dtype=float)
+
+            # overwrite the oldest entries, and update the running sums
+            index = (stream['start'] + np.arange(num_new)) % nrows
+            old_errors = stream['errors'][index]
+            stream['errors'][index] = new_errors
+            stream['start'] = (stream['start'] + num_new) % nrows
+            stream['sum'] = stream['sum'] - np.sum(old_errors) + np.sum(new_errors)
+            stream['sum_sq'] = stream['sum_sq'] - np.sum(np.square(old_errors)) + np.sum(np.square(new_errors))
+
+            # re-sync the sums each time the buffer wraps, to stop rounding errors accumulating
+            if stream['start'] < num_new:
+                stream['sum'] = np.sum(stream['errors'])
+                stream['sum_sq'] = np.sum(np.square(stream['errors']))
+
+        stream['last_id'] = row_ids[-1]
+        self.stream_data[key] = stream
+
+        mean = stream['sum'] / nrows
+        std = np.sqrt(max(stream['sum_sq'] / nrows - mean * mean, 0.0))
+        threshold = mean + 2.0 * std
+
+        # anything anomalous results in a '1'
+        errors = np.roll(stream['errors'], -stream['start'])
+        return np.where(errors > threshold, 1.0, 0.0)
+
+    # ---------------------------
+
     # evaluate model using the supplied (normalised) dataframe as test data.
     def evaluate(self, data, results):
         
@@ -379,7 +476,7 @@ class ClassifierKeras():
 
         if self.dataframeUtils.is_dataframe(data):
             # convert dataframe to tensor
-            test_tensor = self.dataframeUtils.df_to_tensor(data, self.seq_len)
+            test_tensor = self.dataframeUtils.df_to_tensor(data, self.seq_len, dtype=np.float32)
         else:
             test_tensor = data
 
@@ -420,7 +517,7 @@ class ClassifierKeras():
             self.model = self.load()
 
         cols = df_norm.columns
-        tensor = self.dataframeUtils.df_to_tensor(df_norm, self.seq_len)
+        tensor = self.dataframeUtils.df_to_tensor(df_norm, self.seq_len, dtype=np.float32)
         encoded_tensor = self.model.predict(tensor, verbose=1)
         # print("    encoded_tensor:{}".format(np.shape(encoded_tensor)))
         encode_array = encoded_tensor[:, 0, :]
@@ -443,7 +540,7 @@ class ClassifierKeras():
             self.encoder = self.model.get_layer(self.encoder_layer)
         cols = df_norm.columns
         # tensor = np.array(df_norm).reshape(df_norm.shape[0], 1, df_norm.shape[1])
-        tensor = self.dataframeUtils.df_to_tensor(df_norm, self.seq_len)
+        tensor = self.dataframeUtils.df_to_tensor(df_norm, self.seq_len, dtype=np.float32)
         encoded_tensor = self.encoder.predict(tensor, verbose=1)
         encoded_array = encoded_tensor.reshape(np.shape(encoded_tensor)[0], np.shape(encoded_tensor)[2])
 
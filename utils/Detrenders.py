@@ -15,8 +15,6 @@ import pywt
 from sklearn.preprocessing import RobustScaler
 from scipy.signal import savgol_filter
 
-import statsmodels.tsa.api as tsa
-from statsmodels.tsa.ar_model import ar_select_order
 
 class base_detrender(ABC):
 
@@ -37,18 +35,33 @@ class base_detrender(ABC):
         # base implementation is to just returns the original
         return data    # function to detrend the supplied 1d signal
 
+    # detrend 2d array (each column separately). Default implementation just processes one column at a time,
+    # subclasses should override this with a matrix version.
+    # Note that the saved state (poly etc.) is that of the last column, and that is what retrend() applies to all columns
+    def detrend_2d(self, data: np.array) -> np.array:
+        ncols = np.shape(data)[1]
+        x_detrend = np.zeros(np.shape(data), dtype=float)
+        for i in range(ncols):
+            col = np.array(data[:, i])
+            x_detrend[:,i] = self.detrend_1d(col)
+        return x_detrend
+
+    # retrend 2d array (each column separately)
+    def retrend_2d(self, data: np.array) -> np.array:
+        ncols = np.shape(data)[1]
+        x_trend = np.zeros(np.shape(data), dtype=float)
+        for i in range(ncols):
+            col = np.array(data[:, i])
+            x_trend[:,i] = self.retrend_1d(col)
+        return x_trend
+
     # detrend 1d or 2d array
     def detrend(self, data: np.array) -> np.array:
 
         if data.ndim == 1:
             return self.detrend_1d(data)
         elif data.ndim == 2:
-            ncols = np.shape(data)[1]
-            x_detrend = np.zeros(np.shape(data), dtype=float)
-            for i in range(ncols):
-                col = np.array(data[:, i])
-                x_detrend[:,i] = self.detrend_1d(col)
-            return x_detrend
+            return self.detrend_2d(data)
         else:
             print(f'    *** ERR: too many dimensions: {np.shape(data)}')
         return data
@@ -59,17 +72,18 @@ class base_detrender(ABC):
         if data.ndim == 1:
             return self.retrend_1d(data)
         elif data.ndim == 2:
-            ncols = np.shape(data)[1]
-            # print(f'    re-trending {ncols} cols')
-            x_trend = np.zeros(np.shape(data), dtype=float)
-            for i in range(ncols):
-                col = np.array(data[:, i])
-                x_trend[:,i] = self.retrend_1d(col)
-            return x_trend
+            return self.retrend_2d(data)
         else:
             print(f'    *** ERR: too many dimensions: {np.shape(data)}')
         return data
 
+    # add the (saved) trend to the last part of each column of a 2d array
+    def add_trend_2d(self, data: np.array) -> np.array:
+        dlen = min(len(data), len(self.poly))
+        x_trend = np.array(data, dtype=float)
+        x_trend[-dlen:] = x_trend[-dlen:] + self.poly[-dlen:].reshape(-1, 1)
+        return x_trend
+
     # return the 'trend' signal. Note that this can be None in some cases
     def get_trend(self) -> np.array:
         return self.poly
@@ -77,33 +91,118 @@ class base_detrender(ABC):
 
 
     # 'extend' the trend polynomial to support predicted values
+    # The trend is modelled as an AR(trend_lags) process (with intercept). The coefficients are fitted by least squares
+    # the first time, and after that they are updated by recursive least squares (RLS) using the newest trend value,
+    # so sliding the window does not need a refit. The RLS update is only valid if the window moved on by exactly one
+    # sample, which is checked against the end of the previous trend. Anything else (gap, jump, different trend) is
+    # refitted. The extension is projected forward using the AR companion matrix.
+
+    trend_lags = 8
+    trend_forget = 0.995  # RLS forgetting factor (1.0 = no forgetting)
+    ar_coeffs = None  # [intercept, a1, ..., ap], fitted to (trend - ar_offset)
+    ar_cov = None  # RLS (inverse) covariance matrix
+    ar_offset = 0.0  # offset applied to the trend (improves conditioning)
+    ar_len = 0  # length of the trend used to fit the model
+    ar_tail = None  # last (trend_lags + 1) values of the trend used in the latest fit/update
+    trend_max_root = 1.01  # max abs root of the AR model before it is refitted
+
+    # discard the fitted trend model (forces a full fit on the next call to extend_trend)
+    def reset_trend_model(self):
+        self.ar_coeffs = None
+        self.ar_cov = None
+        self.ar_offset = 0.0
+        self.ar_len = 0
+        self.ar_tail = None
+        return
 
-    results_forecaster = None
-
-    def extend_trend(self, steps):
-
-
-        N = len(self.poly)
-
+    # get the AR regressors [1, y[t-1], ..., y[t-p]] for each target y[t], t >= p
+    def get_trend_regressors(self, y: np.array) -> np.array:
+        p = self.trend_lags
+        lags = np.lib.stride_tricks.sliding_window_view(y[:-1], p)[:, ::-1]
+        return np.hstack([np.ones((len(lags), 1)), lags])
+
+    # full least squares fit of the AR model
+    def fit_trend_model(self, y: np.array):
+        self.ar_tail = np.array(y[-self.trend_lags - 1:], dtype=float)
+        self.ar_offset = float(np.mean(y))
+        y = y - self.ar_offset
+        X = self.get_trend_regressors(y)
+        self.ar_coeffs = np.linalg.lstsq(X, y[self.trend_lags:], rcond=None)[0]
+        self.ar_cov = np.linalg.pinv(X.T @ X + 1e-6 * np.eye(self.trend_lags + 1))
+        self.ar_len = len(y)
+        return
 
-        # # Create an instance of the AutoReg class with the selected lag order
-        # mod = ar_select_order(self.poly, maxlag=6)
-        # self.model = tsa.AutoReg(self.poly, lags=mod.ar_lags).fit()
-        self.model = tsa.AutoReg(self.poly, lags=8).fit()
-        self.model = tsa.AutoReg(self.poly, lags=steps).fit()
+    # RLS update of the AR model with the most recent value of y
+    def update_trend_model(self, y: np.array):
+        self.ar_tail = np.array(y[-self.trend_lags - 1:], dtype=float)
+        y = y - self.ar_offset
+        x = np.concatenate(([1.0], y[-self.trend_lags - 1:-1][::-1]))
+        px = self.ar_cov @ x
+        gain = px / (self.trend_forget + x @ px)
+        err = y[-1] - x @ self.ar_coeffs
+        self.ar_coeffs = self.ar_coeffs + gain * err
+        self.ar_cov = (self.ar_cov - np.outer(gain, px)) / self.trend_forget
+        return
 
-        # self.model = tsa.SimpleExpSmoothing(self.poly).fit()
+    # compare y with the trend used in the latest fit/update. Returns 0 if it is the same window, 1 if the window has
+    # moved on by exactly one sample, and -1 otherwise (i.e. the model needs to be refitted)
+    def get_trend_shift(self, y: np.array) -> int:
+        if (self.ar_coeffs is None) or (self.ar_tail is None) or (self.ar_len != len(y)):
+            return -1
+        n = len(self.ar_tail)
+        if np.array_equal(y[-n:], self.ar_tail):
+            return 0
+        if np.array_equal(y[-n - 1:-1], self.ar_tail):
+            return 1
+        return -1
+
+    # check that the AR model is not explosive (all roots inside the unit circle, allowing for a unit root)
+    def trend_model_stable(self) -> bool:
+        if not np.all(np.isfinite(self.ar_coeffs)):
+            return False
+        p = self.trend_lags
+        C = np.zeros((p, p), dtype=float)
+        C[0, :] = self.ar_coeffs[1:]
+        C[1:, :-1] = np.eye(p - 1)
+        return np.max(np.abs(np.linalg.eigvals(C))) <= self.trend_max_root
+
+    # project y forward by steps, using powers of the companion matrix of the AR model
+    def project_trend(self, y: np.array, steps) -> np.array:
+        p = self.trend_lags
+
+        # state is [1, y[t], ..., y[t-p+1]]
+        A = np.zeros((p + 1, p + 1), dtype=float)
+        A[0, 0] = 1.0
+        A[1, :] = self.ar_coeffs
+        A[2:, 1:-1] = np.eye(p - 1)
+        state = np.concatenate(([1.0], y[-p:][::-1] - self.ar_offset))
+
+        preds = np.zeros(steps, dtype=float)
+        for i in range(steps):
+            state = A @ state
+            preds[i] = state[1]
+        return preds + self.ar_offset
 
-        # Predict the time series forward N steps
-        preds = self.model.predict(N, N + steps - 1)[-steps:]
+    def extend_trend(self, steps):
 
-        # t = np.arange(0, len(self.poly))
-        # coeff = np.polyfit(t, self.poly, 2)
-        # poly = np.poly1d(coeff)
-        # t2 = np.arange(N+1, N+steps)
-        # preds = poly(t2)
+        N = len(self.poly)
+        y = np.nan_to_num(np.asarray(self.poly, dtype=float))
 
-        poly = np.concatenate((self.poly, preds), dtype=float)
+        if N <= 2 * (self.trend_lags + 1):
+            # not enough data to fit the model, just extend the last value
+            preds = np.full(steps, y[-1])
+        else:
+            shift = self.get_trend_shift(y)
+            if shift < 0:
+                self.fit_trend_model(y)
+            elif shift == 1:
+                self.update_trend_model(y)
+                # RLS can drift to an explosive model (e.g. after a discontinuity in the trend), so refit if needed
+                if not self.trend_model_stable():
+                    self.fit_trend_model(y)
+            preds = self.project_trend(y, steps)
+
+        poly = np.concatenate((y, preds), dtype=float)
         self.poly = poly[-N:]
         return
 
@@ -122,6 +221,12 @@ class null_detrender(base_detrender):
         # just returns the original
         return data
 
+    def detrend_2d(self, data: np.array) -> np.array:
+        return np.array(data, dtype=float)
+
+    def retrend_2d(self, data: np.array) -> np.array:
+        return np.array(data, dtype=float)
+
 #---------------------------------------
 
 class differencing_detrender(base_detrender):
@@ -131,8 +236,7 @@ class differencing_detrender(base_detrender):
     def detrend_1d(self, data: np.array) -> np.array:
         x_detrend = np.zeros(len(data), dtype=float)
         self.x_orig = data[0]
-        for i in range(1, len(data)):
-            x_detrend[i] = data[i] - data[i - 1]
+        x_detrend[1:] = np.diff(data)
 
         self.poly = data - x_detrend
         return x_detrend
@@ -140,9 +244,22 @@ class differencing_detrender(base_detrender):
     def retrend_1d(self, data: np.array) -> np.array:
         x_trend = np.zeros(len(data), dtype=float)
         x_trend[0] = self.x_orig
-        for i in range(1, len(data)):
-            x_trend[i] = data[i] + x_trend[i - 1]
-        return x_trend
+        x_trend[1:] = data[1:]
+        return np.cumsum(x_trend)
+
+    def detrend_2d(self, data: np.array) -> np.array:
+        x_detrend = np.zeros(np.shape(data), dtype=float)
+        self.x_orig = data[0, -1]
+        x_detrend[1:] = np.diff(data, axis=0)
+
+        self.poly = data[:, -1] - x_detrend[:, -1]
+        return x_detrend
+
+    def retrend_2d(self, data: np.array) -> np.array:
+        x_trend = np.zeros(np.shape(data), dtype=float)
+        x_trend[0] = self.x_orig
+        x_trend[1:] = data[1:]
+        return np.cumsum(x_trend, axis=0)
 
 #---------------------------------------
 
@@ -164,6 +281,18 @@ class linear_detrender(base_detrender):
         x_trend[-dlen:] = data[-dlen:] + self.poly[-dlen:]
         return x_trend
 
+    # all columns are fitted with a single least squares solve (polyfit supports 2d targets)
+    def detrend_2d(self, data: np.array) -> np.array:
+        t = np.arange(0, len(data))
+        coeff = np.polyfit(t, data, 1)
+        poly = np.polyval(coeff, data)
+        self.poly = poly[:, -1]
+        x_detrend = data - poly
+        return x_detrend
+
+    def retrend_2d(self, data: np.array) -> np.array:
+        return self.add_trend_2d(data)
+
 #---------------------------------------
 
 
@@ -187,6 +316,16 @@ class quadratic_detrender(base_detrender):
         x_trend[-dlen:] = data[-dlen:] + self.poly[-dlen:]
         return x_trend
 
+    def detrend_2d(self, data: np.array) -> np.array:
+        window = max(8, len(data) // 2)
+        poly = savgol_filter(data, window, 2, axis=0)
+        self.poly = poly[:, -1]
+        x_detrend = data - poly
+        return x_detrend
+
+    def retrend_2d(self, data: np.array) -> np.array:
+        return self.add_trend_2d(data)
+
 #---------------------------------------
 
 
@@ -215,6 +354,19 @@ class smooth_detrender(base_detrender):
         # print(f'x_trend: {x_trend}')
         return x_trend
 
+    def detrend_2d(self, data: np.array) -> np.array:
+        # box filter on all columns, using running sums. Same alignment as np.convolve(mode="same")
+        window = 12
+        padded = np.pad(np.asarray(data, dtype=float), ((window // 2, (window - 1) // 2), (0, 0)))
+        csum = np.concatenate([np.zeros((1, np.shape(data)[1])), np.cumsum(padded, axis=0)])
+        poly = (csum[window:] - csum[:-window]) / window
+        self.poly = poly[:, -1]
+        x_detrend = data - poly
+        return x_detrend
+
+    def retrend_2d(self, data: np.array) -> np.array:
+        return self.add_trend_2d(data)
+
 #---------------------------------------
 
 
@@ -250,6 +402,24 @@ class scaler_detrender(base_detrender):
             x_trend = x_trend.reshape(-1).squeeze()
         return x_trend
 
+    # RobustScaler scales each column independently, so all columns can be done at once
+    def detrend_2d(self, data: np.array) -> np.array:
+        x_trend = np.nan_to_num(np.array(data, dtype=float))
+        x_detrend = RobustScaler().fit_transform(x_trend)
+
+        # saved scaler is for the last column (used by retrend)
+        if self.scaler is None:
+            self.scaler = RobustScaler()
+        self.scaler = self.scaler.fit(x_trend[:, -1:])
+
+        self.poly = data[:, -1] - x_detrend[:, -1]
+
+        return x_detrend
+
+    def retrend_2d(self, data: np.array) -> np.array:
+        x_trend = self.scaler.inverse_transform(np.array(data, dtype=float).reshape(-1, 1))
+        return x_trend.reshape(np.shape(data))
+
 #---------------------------------------
 
 
@@ -271,6 +441,17 @@ class fft_detrender(base_detrender):
         x_trend[-dlen:] = data[-dlen:] + self.poly[-dlen:]
         return x_trend
 
+    def detrend_2d(self, data: np.array) -> np.array:
+        xf = np.fft.fft(data, axis=0)
+        xf[4:] = 0.0
+        poly = np.fft.ifft(xf, axis=0).real
+        self.poly = poly[:, -1]
+        x_detrend = data - poly
+        return x_detrend
+
+    def retrend_2d(self, data: np.array) -> np.array:
+        return self.add_trend_2d(data)
+
 #---------------------------------------
 
 
@@ -318,6 +499,31 @@ class dwt_detrender(base_detrender):
         x_trend[-dlen:] = data[-dlen:] + self.poly[-dlen:]
         return np.nan_to_num(x_trend)
 
+    # all columns are decomposed/reconstructed together, with a per-column threshold
+    def detrend_2d(self, data: np.array) -> np.array:
+        coeffs = pywt.wavedec(data, self.wavelet, level=self.level, mode='per', axis=0)
+
+        # saved coefficients are for the last column
+        self.coeffs = [c[:, -1] for c in coeffs]
+
+        threshold = 0.99
+        thresh = threshold * np.nanmax(data, axis=0)
+        coeffs[1:] = [pywt.threshold(c, thresh.reshape(1, -1), 'soft') for c in coeffs[1:]]
+
+        poly = pywt.waverec(coeffs, self.wavelet, mode='per', axis=0)
+
+        if len(data) != len(poly):
+            dlen = min(len(data), len(poly))
+            poly = poly[-dlen:]
+
+        self.poly = poly[:, -1]
+        x_detrend = data - poly
+
+        return np.nan_to_num(x_detrend)
+
+    def retrend_2d(self, data: np.array) -> np.array:
+        return np.nan_to_num(self.add_trend_2d(data))
+
 #---------------------------------------
 
 class DetrenderType(Enum):
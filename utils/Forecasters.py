@@ -14,6 +14,8 @@ Note that these are based on both statsmodel and sklearn packages.
 
 from abc import ABC, abstractmethod
 from enum import Enum
+import copy
+from math import comb
 
 import numpy as np
 import pandas as pd
@@ -23,6 +25,7 @@ import statsmodels.tsa.api as tsa
 from statsmodels.tsa.forecasting.theta import ThetaModel
 from statsmodels.tsa.ar_model import ar_select_order
 from xgboost import XGBRegressor
+from xgboost import Booster as XGBBooster
 
 import lightgbm as lgbm
 from sklearn.linear_model import PassiveAggressiveRegressor
@@ -84,6 +87,148 @@ class NullRegressor(BaseEstimator):
 
 # -----------------------------------
 
+# helper functions for checkpointing forecaster state (see base_forecaster.snapshot())
+
+# copy an attribute value. Arrays are copied, containers are copied element-wise, boosters are shared (training
+# always creates a new booster rather than updating the old one) and anything else is deep copied (these are small)
+def copy_state_value(value):
+    if isinstance(value, np.ndarray):
+        return value.copy()
+    elif isinstance(value, (list, tuple)):
+        return type(value)(copy_state_value(v) for v in value)
+    elif isinstance(value, dict):
+        return {k: copy_state_value(v) for k, v in value.items()}
+    elif isinstance(value, (lgbm.Booster, XGBBooster)):
+        return value
+    else:
+        return copy.deepcopy(value)
+
+
+# check whether an array can be overwritten in place with the saved version
+def can_copy_in_place(curr, saved) -> bool:
+    return (isinstance(curr, np.ndarray) and isinstance(saved, np.ndarray) and
+            (curr.base is None) and curr.flags.writeable and
+            (curr.shape == saved.shape) and (curr.dtype == saved.dtype))
+
+
+# restore attributes from a saved copy. If in_place is set, arrays (and lists of arrays) that are unchanged in
+# shape/type are overwritten rather than re-allocated
+def restore_state_attrs(target: dict, saved: dict, in_place=False, skip=()):
+    for key in [k for k in target if (k not in saved) and (k not in skip)]:
+        del target[key]
+
+    for key, value in saved.items():
+        curr = target.get(key, None)
+        if in_place and can_copy_in_place(curr, value):
+            np.copyto(curr, value)
+        elif (in_place and isinstance(value, list) and isinstance(curr, list) and (len(curr) == len(value)) and
+              all(can_copy_in_place(c, v) for c, v in zip(curr, value))):
+            for c, v in zip(curr, value):
+                np.copyto(c, v)
+        else:
+            target[key] = copy_state_value(value)
+    return
+
+# -----------------------------------
+
+# helper classes for the streaming interface (see base_forecaster.start_stream())
+
+# least squares polynomial fit over a sliding window, maintained via running sums, so each update is O(1)
+# Positions are scaled to i/N to keep the normal equations well conditioned
+class RunningPolyFit():
+    def __init__(self, data: np.array, degree):
+        self.degree = degree
+        self.window = len(data)
+        self.scale = 1.0 / self.window
+        self.buffer = np.array(data, dtype=float)  # ring buffer, oldest value at self.pos
+        self.pos = 0
+        self.count = 0
+
+        # powers of the (scaled) positions, and the inverse of the normal equations (these never change)
+        self.powers = np.vander(np.arange(self.window) * self.scale, degree + 1, increasing=True)
+        self.gram_inv = np.linalg.pinv(self.powers.T @ self.powers)
+
+        # matrix to shift all positions down by 1: sum(x*(u-h)^k) = sum_j C(k,j) * (-h)^(k-j) * sum(x*u^j)
+        self.shift = np.zeros((degree + 1, degree + 1), dtype=float)
+        for k in range(degree + 1):
+            for j in range(k + 1):
+                self.shift[k, j] = comb(k, j) * (-self.scale) ** (k - j)
+
+        self.moments = self.buffer @ self.powers
+        return
+
+    def update(self, value):
+        # remove oldest value (position 0), shift positions down, then add new value at the end
+        self.moments[0] -= self.buffer[self.pos]
+        self.moments = self.shift @ self.moments
+        self.moments += value * self.powers[-1]
+
+        self.buffer[self.pos] = value
+        self.pos = (self.pos + 1) % self.window
+        self.count += 1
+
+        # periodically recalculate from scratch, so that rounding errors don't accumulate
+        if (self.count % self.window) == 0:
+            self.moments = np.roll(self.buffer, -self.pos) @ self.powers
+        return
+
+    # get the fitted value 'steps' beyond the last value
+    def predict(self, steps):
+        coeffs = self.gram_inv @ self.moments
+        u = (self.window - 1 + steps) * self.scale
+        return float(np.dot(coeffs, u ** np.arange(self.degree + 1)))
+
+
+# Autoregressive model, updated via Recursive Least Squares. The forgetting factor sets the effective memory
+class RecursiveAR():
+    def __init__(self, data: np.array, lags, forget=0.99, reg=1.0e-3):
+        self.lags = max(1, lags)
+        self.forget = forget
+        x = np.array(data, dtype=float)
+
+        # initial estimate via (batch) least squares. Regressors are [1, x(t-1), ..., x(t-lags)]
+        n = len(x) - self.lags
+        if n > 0:
+            X = np.ones((n, self.lags + 1), dtype=float)
+            for i in range(self.lags):
+                X[:, i + 1] = x[self.lags - i - 1 : self.lags - i - 1 + n]
+            y = x[self.lags :]
+            self.P = np.linalg.pinv(X.T @ X + reg * np.eye(self.lags + 1))
+            self.theta = self.P @ (X.T @ y)
+        else:
+            self.P = np.eye(self.lags + 1) / reg
+            self.theta = np.zeros(self.lags + 1, dtype=float)
+
+        # most recent values, newest first
+        self.history = np.zeros(self.lags, dtype=float)
+        hlen = min(self.lags, len(x))
+        if hlen > 0:
+            self.history[:hlen] = x[::-1][:hlen]
+        return
+
+    def update(self, value):
+        phi = np.concatenate(([1.0], self.history))
+        Pphi = self.P @ phi
+        gain = Pphi / (self.forget + phi @ Pphi)
+        self.theta = self.theta + gain * (value - phi @ self.theta)
+        self.P = (self.P - np.outer(gain, Pphi)) / self.forget
+
+        self.history = np.roll(self.history, 1)
+        self.history[0] = value
+        return
+
+    # iterate the model forward 'steps' values, return the last one
+    def predict(self, steps):
+        history = self.history.copy()
+        value = 0.0
+        for _ in range(max(1, steps)):
+            value = self.theta[0] + np.dot(self.theta[1:], history)
+            history = np.roll(history, 1)
+            history[0] = value
+        return float(value)
+
+# -----------------------------------
+
 # all actual instantiations follow this base class
 
 
@@ -100,6 +245,13 @@ class base_forecaster(ABC):
     smooth_data = False
     smooth_window = 4
     external_model = False
+    support_multi_output = False
+    support_streaming = False
+    exact_streaming = False  # True if predict_next() gives the same results as forecast() on the same window
+    approx_streaming = False  # set to True to also use streaming when it is only an approximation
+    stream_len = 0  # length of the window used to start the stream (0 = not started)
+    stream_tail = None  # last stream_check_len values added to the stream
+    stream_check_len = 8  # no. of values used to check that the stream is in sync with the data
 
     def __init__(self):
         super().__init__()
@@ -159,6 +311,18 @@ class base_forecaster(ABC):
     def requires_pretraining(self):
         return self.requires_training
 
+    # specifies whether the forecaster supports multi-output (stacked) training/forecasting (train_multi()/forecast_multi())
+    def supports_multi_output(self) -> bool:
+        return self.support_multi_output and (not self.smooth_data)
+
+    # specifies whether the forecaster supports streaming (update()/predict_next()).
+    # Smoothing and detrending operate on the whole window, so cannot be applied incrementally.
+    # Some forecasters only approximate forecast() when streaming (e.g. parameters are fixed when the stream is started),
+    # so those are only used if approx_streaming is set
+    def supports_streaming(self) -> bool:
+        return self.support_streaming and (self.exact_streaming or self.approx_streaming) and \
+            (not self.smooth_data) and (not self.detrend_data)
+
     # function to train based on known results. Not all forecasters support this.
     def train(self, train_data: np.array, results: np.array, incremental=True):
         return
@@ -169,6 +333,120 @@ class base_forecaster(ABC):
         # base implementation is to just return zeros
         return np.zeros(steps, dtype=float)
 
+    # -----------------------------------
+    # multi-output interface. Each column of the data is treated as a separate (1d) series, and a single model is
+    # trained across all of them by stacking the columns into one feature. Only applies to models that predict
+    # row-by-row (i.e. sklearn-style regressors). Detrending is done per column, and the trend is treated as additive
+    # Note that this is a different model from training one forecaster per column, so results will differ (for
+    # forecasters that refit per column, such as HGB, SVR, LGBM). It is opt-in for that reason
+
+    multi_results_trend = None
+
+    def train_multi(self, train_data: np.array, results: np.array, incremental=True):
+        x = np.nan_to_num(train_data)
+        y = np.nan_to_num(results)
+
+        if self.detrend_data:
+            x, _ = self.detrend_columns(x)
+            y, self.multi_results_trend = self.detrend_columns(y)
+
+        # columns are stacked in order, so training sees each series in turn
+        detrend_flag = self.detrend_data
+        self.detrend_data = False
+        self.train(x.reshape(-1, 1, order="F"), y.reshape(-1, order="F"), incremental=incremental)
+        self.detrend_data = detrend_flag
+        return
+
+    # returns the prediction for the last row of each column
+    def forecast_multi(self, data: np.array, steps) -> np.array:
+        x = np.nan_to_num(data)
+
+        if self.detrend_data:
+            x, _ = self.detrend_columns(x)
+
+        detrend_flag = self.detrend_data
+        self.detrend_data = False
+        preds = np.ravel(self.forecast(x[-1].reshape(-1, 1), steps))
+        self.detrend_data = detrend_flag
+
+        if self.detrend_data and (self.multi_results_trend is not None):
+            preds = preds + self.multi_results_trend
+        return preds
+
+    # detrend each column separately. Returns the detrended data and the (last) trend value of each column
+    def detrend_columns(self, x: np.array):
+        detrender = Detrenders.make_detrender(self.detrender_type)
+        x_detrend = np.zeros(np.shape(x), dtype=float)
+        for i in range(np.shape(x)[1]):
+            x_detrend[:, i] = detrender.detrend_1d(np.array(x[:, i]))
+        return x_detrend, x[-1] - x_detrend[-1]
+
+    # -----------------------------------
+    # streaming interface. start_stream() initialises the state from a window of data (fitting parameters if needed),
+    # then update() adds one new value at a time and predict_next() forecasts from the current state, both in O(1).
+    # predict_next(steps) corresponds to the last value returned by forecast(data, steps)
+
+    def start_stream(self, data: np.array):
+        x = self.check_1d(np.nan_to_num(np.array(data, dtype=float)))
+        self.stream_len = len(x)
+        self.stream_tail = x[-self.stream_check_len:].copy()
+        self.init_stream(x)
+        return
+
+    def update(self, new_value):
+        value = float(np.nan_to_num(np.ravel(new_value)[0]))
+        self.stream_tail = np.append(self.stream_tail, value)[-self.stream_check_len:]
+        self.update_stream(value)
+        return
+
+    # returns True if data is the window the stream was last at, moved on by one new value (i.e. same length, and the
+    # last values added to the stream match the data just before the new value)
+    def stream_in_sync(self, data: np.array) -> bool:
+        x = self.check_1d(np.nan_to_num(np.array(data, dtype=float)))
+        if (self.stream_len != len(x)) or (self.stream_tail is None) or (len(x) <= len(self.stream_tail)):
+            return False
+        return np.array_equal(self.stream_tail, x[-len(self.stream_tail) - 1 : -1])
+
+    def predict_next(self, steps) -> float:
+        return 0.0
+
+    # the following are implemented by forecasters that support streaming
+    def init_stream(self, x: np.array):
+        return
+
+    def update_stream(self, value):
+        return
+
+    # -----------------------------------
+    # lightweight checkpointing, for resetting a model between training windows without using copy.deepcopy()
+    # Only the instance attributes of the forecaster and (for sklearn-style models) the fitted attributes of the model
+    # are captured. restore() must be called on the same forecaster that was used for snapshot()
+
+    # capture the current state of the forecaster
+    def snapshot(self):
+        state = {
+            "attrs": {k: copy_state_value(v) for k, v in vars(self).items() if k != "model"},
+            "model": self.model,
+            "model_attrs": None,
+        }
+
+        # sklearn models are updated in place, so save their attributes. Other models (statsmodels results,
+        # boosters) are replaced when trained, so just keeping a reference is enough
+        if isinstance(self.model, BaseEstimator):
+            state["model_attrs"] = {k: copy_state_value(v) for k, v in vars(self.model).items()}
+
+        return state
+
+    # restore the forecaster to a state previously captured by snapshot()
+    def restore(self, state):
+        restore_state_attrs(vars(self), state["attrs"], in_place=False, skip=("model",))
+
+        self.model = state["model"]
+        if state["model_attrs"] is not None:
+            # model owns its fitted arrays, so they can be overwritten in place
+            restore_state_attrs(vars(self.model), state["model_attrs"], in_place=True)
+        return
+
 
     # -----------------------------------
 
@@ -210,6 +488,7 @@ class base_forecaster(ABC):
         # return x_trend # temp
 
     results_detrender = None
+    extend_results_trend = False  # extend the results trend by the forecast steps before re-trending
 
     def detrend_results(self, x, axis=0):
 
@@ -223,7 +502,8 @@ class base_forecaster(ABC):
 
     def retrend_results(self, x_trend, steps, axis=0):
 
-        # self.results_detrender.extend_trend(steps) # this is computationaly very expensive
+        if self.extend_results_trend:
+            self.results_detrender.extend_trend(steps)
         x = self.results_detrender.retrend(x_trend)
         return x
         # return x_trend # temp
@@ -311,6 +591,9 @@ class null_forecaster(base_forecaster):
 
 
 class linear_forecaster(base_forecaster):
+    support_streaming = True
+    exact_streaming = True
+
     def get_name(self):
         return "Linear"
 
@@ -351,11 +634,26 @@ class linear_forecaster(base_forecaster):
 
         return predictions.squeeze()
 
+    # streaming version, using running sums over the window
+    def init_stream(self, x: np.array):
+        self.stream = RunningPolyFit(x, 1)
+        return
+
+    def update_stream(self, value):
+        self.stream.update(value)
+        return
+
+    def predict_next(self, steps) -> float:
+        return self.stream.predict(steps)
+
 
 # -----------------------------------
 
 
 class quadratic_forecaster(base_forecaster):
+    support_streaming = True
+    exact_streaming = True
+
     def get_name(self):
         return "Quadratic"
 
@@ -393,7 +691,17 @@ class quadratic_forecaster(base_forecaster):
 
         return predictions.squeeze()
 
+    # streaming version, using running sums over the window
+    def init_stream(self, x: np.array):
+        self.stream = RunningPolyFit(x, 3)
+        return
+
+    def update_stream(self, value):
+        self.stream.update(value)
+        return
 
+    def predict_next(self, steps) -> float:
+        return self.stream.predict(steps)
 
 
 # -----------------------------------
@@ -571,6 +879,8 @@ class fft_extrapolation_forecaster(base_forecaster):
 
 
 class exponential_forecaster(base_forecaster):
+    support_streaming = True  # approximate, so only used if approx_streaming is set
+
     def get_name(self):
         return "Exponential"
 
@@ -595,6 +905,22 @@ class exponential_forecaster(base_forecaster):
             predictions = self.retrend(predictions)
 
         return predictions.squeeze()
+
+    # streaming version. Parameters are estimated when the stream is started, then the level is updated recursively
+    def init_stream(self, x: np.array):
+        self.model = tsa.ExponentialSmoothing(x).fit()
+        self.alpha = self.model.params["smoothing_level"]
+        self.level = self.model.level[-1]
+        return
+
+    def update_stream(self, value):
+        self.level = self.alpha * value + (1.0 - self.alpha) * self.level
+        return
+
+    def predict_next(self, steps) -> float:
+        return float(self.level)
+
+
 # -----------------------------------
 
 
@@ -629,6 +955,8 @@ class statespace_exponential_forecaster(base_forecaster):
 
 
 class holt_forecaster(base_forecaster):
+    support_streaming = True  # approximate, so only used if approx_streaming is set
+
     def get_name(self):
         return "Holt"
 
@@ -659,11 +987,33 @@ class holt_forecaster(base_forecaster):
 
         return predictions.squeeze()[-len(x):]
 
+    # streaming version. Parameters are estimated when the stream is started, then level & trend are updated recursively
+    def init_stream(self, x: np.array):
+        self.model = tsa.Holt(x, damped_trend=True, initialization_method="estimated").fit()
+        self.alpha = self.model.params["smoothing_level"]
+        self.beta = self.model.params["smoothing_trend"]
+        self.phi = self.model.params["damping_trend"]
+        self.level = self.model.level[-1]
+        self.trend = self.model.trend[-1]
+        return
+
+    def update_stream(self, value):
+        prev_level = self.level
+        self.level = self.alpha * value + (1.0 - self.alpha) * (prev_level + self.phi * self.trend)
+        self.trend = self.beta * (self.level - prev_level) + (1.0 - self.beta) * self.phi * self.trend
+        return
+
+    def predict_next(self, steps) -> float:
+        damping = np.sum(self.phi ** np.arange(1, steps + 1))
+        return float(self.level + damping * self.trend)
+
 
 # -----------------------------------
 
 
 class simple_exponential_forecaster(base_forecaster):
+    support_streaming = True  # approximate, so only used if approx_streaming is set
+
     def get_name(self):
         return "SimpleExponential"
 
@@ -690,6 +1040,20 @@ class simple_exponential_forecaster(base_forecaster):
 
         return predictions.squeeze()
 
+    # streaming version. Parameters are estimated when the stream is started, then the level is updated recursively
+    def init_stream(self, x: np.array):
+        self.model = tsa.SimpleExpSmoothing(x, initialization_method="estimated").fit()
+        self.alpha = self.model.params["smoothing_level"]
+        self.level = self.model.level[-1]
+        return
+
+    def update_stream(self, value):
+        self.level = self.alpha * value + (1.0 - self.alpha) * self.level
+        return
+
+    def predict_next(self, steps) -> float:
+        return float(self.level)
+
 
 # -----------------------------------
 
@@ -772,6 +1136,8 @@ class arima_forecaster(base_forecaster):
 
 
 class ar_forecaster(base_forecaster):
+    support_streaming = True  # approximate, so only used if approx_streaming is set
+
     def get_name(self):
         return "AutoReg"
 
@@ -809,6 +1175,21 @@ class ar_forecaster(base_forecaster):
             predictions = self.retrend(predictions)
         return predictions.squeeze()
 
+    # streaming version. The lag order is selected when the stream is started, then the coefficients are updated via
+    # recursive least squares (with a memory of roughly the window length)
+    def init_stream(self, x: np.array):
+        mod = ar_select_order(x, maxlag=15)
+        lags = max(mod.ar_lags) if mod.ar_lags else 1
+        self.stream = RecursiveAR(x, lags, forget=1.0 - 1.0 / max(len(x), 2))
+        return
+
+    def update_stream(self, value):
+        self.stream.update(value)
+        return
+
+    def predict_next(self, steps) -> float:
+        return self.stream.predict(steps)
+
 
 # -----------------------------------
 
@@ -861,6 +1242,7 @@ class gb_forecaster(base_forecaster):
     reuse_model = True
     n_estimators = 100
     support_multiple_columns = True
+    support_multi_output = True
     support_retrain = True
     requires_training = True
 
@@ -913,6 +1295,7 @@ class gb_forecaster(base_forecaster):
 class hgb_forecaster(base_forecaster):
     reuse_model = False
     support_multiple_columns = True
+    support_multi_output = True
     support_retrain = False
     requires_training = True
 
@@ -994,6 +1377,7 @@ class kmeans_forecaster(base_forecaster):
 class lgbm_forecaster(base_forecaster):
     reuse_model = False
     support_multiple_columns = True
+    support_multi_output = True
     support_retrain = False # takes too long if True
     requires_training = True
 
@@ -1085,6 +1469,7 @@ class lgbm_forecaster(base_forecaster):
 class mlp_forecaster(base_forecaster):
     reuse_model = True
     support_multiple_columns = True
+    support_multi_output = True
     support_retrain = True
     requires_training = True
 
@@ -1163,6 +1548,7 @@ class mlp_forecaster(base_forecaster):
 class pa_forecaster(base_forecaster):
     reuse_model = True
     support_multiple_columns = True
+    support_multi_output = True
     support_retrain = True
     requires_training = True
 
@@ -1245,6 +1631,7 @@ class pa_forecaster(base_forecaster):
 class sgd_forecaster(base_forecaster):
     reuse_model = True
     support_multiple_columns = True
+    support_multi_output = True
     support_retrain = True
     requires_training = True
 
@@ -1298,6 +1685,7 @@ class sgd_forecaster(base_forecaster):
 
 class svr_forecaster(base_forecaster):
     support_multiple_columns = True
+    support_multi_output = True
     support_retrain = False
     requires_training = True
 
@@ -1336,6 +1724,7 @@ class svr_forecaster(base_forecaster):
 class xgb_forecaster(base_forecaster):
 
     support_multiple_columns = True
+    support_multi_output = True
     support_retrain = True
     requires_training = True
 
@@ -0,0 +1,217 @@
+# Disk-backed store for populated indicator dataframes
+#
+# In backtest and hyperopt, the indicators are calculated from the same (static) data over and over again: every
+# hyperopt run, every backtest of the same timerange, and every process that has to rebuild the data. For strategies
+# with expensive indicators (DWT, coefficient tables, rolling predictions etc.) this dominates the time to the first
+# epoch, and every process holds its own copy of the results.
+#
+# This saves the columns added by the indicator code as .npy files (one block per dtype, so that no conversion is
+# needed when loading), keyed by (strategy, pair, timerange, indicator-set hash). Later calls attach the blocks via a
+# memory map, so processes share the same physical pages (through the OS page cache) instead of recomputing or
+# unpickling their own copy.
+# The map is opened copy-on-write, so code that modifies a column in place just gets a private copy of the pages that
+# it touches, and the stored data never changes.
+#
+# The indicator-set hash covers the source of the strategy code (every loaded module under the root directory), the
+# simple class attributes of the owner (wavelet sizes, lookahead etc.), the current values of any hyperopt parameters
+# (which can come from the parameter file, or change every epoch in hyperopt), any extra config supplied by the caller
+# and a fingerprint of the input data, so any change results in a new entry rather than stale data.
+# Only numeric columns can be stored. If the new columns include other types, nothing is saved.
+#
+# Usage:
+#   store = IndicatorStore(store_dir, root_dir)
+#   key = store.get_key(self, pair, dataframe)
+#   df = store.load(key, dataframe)
+#   if df is None:
+#       input_cols = dataframe.columns
+#       ... add indicators ...
+#       store.save(key, dataframe, input_cols)
+
+import hashlib
+import json
+import os
+import sys
+from enum import Enum
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+
+class IndicatorStore:
+
+    store_dir = ""
+    root_dir = ""
+    source_hash = None  # hash of the strategy source files (calculated once)
+    verbose = False
+
+    def __init__(self, store_dir: str, root_dir: str = ""):
+        self.store_dir = store_dir
+        self.root_dir = root_dir
+        os.makedirs(self.store_dir, exist_ok=True)
+
+    # hash of the source files of all loaded modules under root_dir
+    def get_source_hash(self) -> str:
+        if self.source_hash is None:
+            h = hashlib.sha1()
+            if self.root_dir:
+                root = os.path.abspath(self.root_dir)
+                files = set()
+                for module in list(sys.modules.values()):
+                    path = getattr(module, '__file__', None)
+                    if path and os.path.abspath(path).startswith(root) and path.endswith('.py'):
+                        files.add(os.path.abspath(path))
+                for path in sorted(files):
+                    with open(path, 'rb') as f:
+                        h.update(f.read())
+            self.source_hash = h.hexdigest()
+        return self.source_hash
+
+    # hash of the 'simple' class attributes of an object (and its base classes)
+    def get_attr_hash(self, owner) -> str:
+        h = hashlib.sha1()
+        for cls in reversed(type(owner).__mro__):
+            for name, value in sorted(vars(cls).items()):
+                if name.startswith('_'):
+                    continue
+                if isinstance(value, (bool, int, float, str, Enum, type(None))):
+                    h.update(f"{cls.__name__}.{name}={value!r};".encode())
+        return h.hexdigest()
+
+    # hash of the current values of the hyperopt parameters (freqtrade Parameter objects) of the owner.
+    # These are not simple attributes, and their values are set at runtime (parameter file, hyperopt epochs)
+    def get_param_hash(self, owner) -> str:
+        h = hashlib.sha1()
+        if hasattr(owner, 'detect_all_parameters'):
+            for space, params in sorted(owner.detect_all_parameters().items()):
+                if isinstance(params, dict):
+                    params = params.items()
+                for item in params:
+                    if not (isinstance(item, tuple) and len(item) == 2):
+                        continue
+                    name, param = item
+                    param = getattr(owner, name, param)
+                    h.update(f"{space}.{name}={getattr(param, 'value', None)!r};".encode())
+        return h.hexdigest()
+
+    # fingerprint of the input data (content, not just the dates)
+    def get_data_hash(self, dataframe: DataFrame) -> str:
+        h = hashlib.sha1()
+        for col in dataframe.columns:
+            values = dataframe[col].to_numpy()
+            if values.dtype.kind in 'biufM':
+                h.update(col.encode())
+                h.update(np.ascontiguousarray(values).tobytes())
+        return h.hexdigest()
+
+    # get the key for an entry. owner is the object that adds the indicators (e.g. the strategy),
+    # extra is anything else that affects the results (must have a stable repr())
+    def get_key(self, owner, pair: str, dataframe: DataFrame, extra=None) -> str:
+        name = type(owner).__name__
+        pair_name = pair.replace('/', '_').replace(':', '_')
+        dates = ""
+        if ('date' in dataframe.columns) and (len(dataframe) > 0):
+            start = pd.Timestamp(dataframe['date'].iloc[0]).strftime('%Y%m%d%H%M')
+            end = pd.Timestamp(dataframe['date'].iloc[-1]).strftime('%Y%m%d%H%M')
+            dates = f"{start}-{end}"
+
+        h = hashlib.sha1()
+        h.update(self.get_source_hash().encode())
+        h.update(self.get_attr_hash(owner).encode())
+        h.update(self.get_param_hash(owner).encode())
+        h.update(self.get_data_hash(dataframe).encode())
+        h.update(repr(extra).encode())
+
+        return f"{name}_{pair_name}_{dates}_{len(dataframe)}_{h.hexdigest()[:16]}"
+
+    def get_meta_path(self, key: str) -> str:
+        return os.path.join(self.store_dir, key) + ".json"
+
+    def get_data_path(self, key: str, dtype: str) -> str:
+        return os.path.join(self.store_dir, key) + f".{dtype}.npy"
+
+    # attach the stored indicators to dataframe. Returns None if there is no (valid) entry
+    def load(self, key: str, dataframe: DataFrame):
+        meta_path = self.get_meta_path(key)
+
+        # metadata is written last, so if it exists then the data is complete
+        if not os.path.exists(meta_path):
+            return None
+
+        try:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            blocks = [np.load(self.get_data_path(key, dtype), mmap_mode='c') for dtype in meta['blocks']]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"    IndicatorStore: error loading {key}: {e}")
+            return None
+
+        if meta['nrows'] != len(dataframe):
+            print(f"    IndicatorStore: size mismatch for {key}. Ignoring")
+            return None
+
+        # DataFrames use the (transposed) maps directly, no copy or conversion
+        frames = []
+        for (dtype, columns), block in zip(meta['blocks'].items(), blocks):
+            if (np.shape(block) != (len(columns), len(dataframe))) or (block.dtype != np.dtype(dtype)):
+                print(f"    IndicatorStore: size mismatch for {key}. Ignoring")
+                return None
+            frames.append(DataFrame(block.T, columns=columns, index=dataframe.index, copy=False))
+
+        base = dataframe.drop(columns=[c for c in meta['columns'] if c in dataframe.columns])
+        dataframe = pd.concat([base] + frames, axis=1)
+
+        # restore the original column order
+        dataframe = dataframe[list(base.columns) + meta['columns']]
+
+        if self.verbose:
+            print(f"    IndicatorStore: loaded {key} ({len(meta['columns'])} columns)")
+
+        return dataframe
+
+    # save the columns that are not in input_cols
+    def save(self, key: str, dataframe: DataFrame, input_cols) -> bool:
+        columns = [c for c in dataframe.columns if c not in input_cols]
+        if len(columns) == 0:
+            return False
+
+        dtypes = [dataframe[c].dtype for c in columns]
+        if not all(isinstance(dt, np.dtype) and (dt.kind in 'biuf') for dt in dtypes):
+            print(f"    IndicatorStore: non-numeric columns, not saving {key}")
+            return False
+
+        # group the columns by dtype, each group is saved as a single block in its native type
+        groups = {}
+        for col, dt in zip(columns, dtypes):
+            groups.setdefault(str(dt), []).append(col)
+
+        meta = {
+            'columns': [str(c) for c in columns],
+            'blocks': {dtype: [str(c) for c in cols] for dtype, cols in groups.items()},
+            'nrows': len(dataframe)
+        }
+
+        # write to temp files and rename, so that concurrent readers never see a partial entry
+        pid = os.getpid()
+        try:
+            for dtype, cols in groups.items():
+                data_path = self.get_data_path(key, dtype)
+                block = np.empty((len(cols), len(dataframe)), dtype=np.dtype(dtype))
+                for i, col in enumerate(cols):
+                    block[i] = dataframe[col].to_numpy()
+                with open(f"{data_path}.{pid}.tmp", 'wb') as f:
+                    np.save(f, block)
+                os.replace(f"{data_path}.{pid}.tmp", data_path)
+
+            meta_path = self.get_meta_path(key)
+            with open(f"{meta_path}.{pid}.tmp", 'w') as f:
+                json.dump(meta, f)
+            os.replace(f"{meta_path}.{pid}.tmp", meta_path)
+        except OSError as e:
+            print(f"    IndicatorStore: error saving {key}: {e}")
+            return False
+
+        if self.verbose:
+            print(f"    IndicatorStore: saved {key} ({len(columns)} columns)")
+
+        return True
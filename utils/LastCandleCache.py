@@ -0,0 +1,92 @@
+# Mixin class that provides a fast lookup of the 'last candle' for custom_exit() (and similar callbacks)
+#
+# freqtrade calls custom_exit() for every open trade on every candle (and every few seconds in live mode), and the
+# usual pattern:
+#     dataframe, _ = self.dp.get_analyzed_dataframe(pair=pair, timeframe=self.timeframe)
+#     last_candle = dataframe.iloc[-1].squeeze()
+# slices the dataframe (in backtest) and then builds a Series for the whole row, just to read a few columns.
+#
+# Instead, the strategy lists the (numeric) columns that it needs in exit_candle_fields, and calls
+# update_exit_candles() at the end of populate_exit_trend(). The columns are extracted once into a numpy array, and
+# get_last_candle() returns a small dict containing just those fields.
+# In backtest/hyperopt, the candle is found from current_time (using the same rule as the DataProvider, i.e. the last
+# candle that is complete at current_time), in live/dry-run mode it is just the last candle.
+# If the data is not available for some reason, it falls back to the DataProvider.
+#
+# Usage:
+#   class MyStrategy(LastCandleCache, IStrategy):
+#       exit_candle_fields = ['volume', 'exit_long', ...]
+#
+#       def populate_exit_trend(self, dataframe, metadata):
+#           ...
+#           self.update_exit_candles(dataframe, metadata['pair'])
+#           return dataframe
+#
+#       def custom_exit(self, pair, trade, current_time, ...):
+#           last_candle = self.get_last_candle(pair, current_time)
+
+
+import numpy as np
+from pandas import DataFrame
+
+from freqtrade.exchange import timeframe_to_seconds
+
+
+class LastCandleCache:
+
+    exit_candle_fields = []  # columns used by custom_exit() etc. Must be numeric
+    exit_candle_cache = None  # pair-specific data: (dates, values)
+
+    # extract the exit fields for a pair. Call at the end of populate_exit_trend()
+    def update_exit_candles(self, dataframe: DataFrame, pair: str):
+
+        if self.exit_candle_cache is None:
+            self.exit_candle_cache = {}
+
+        missing = [f for f in self.exit_candle_fields if f not in dataframe.columns]
+        if (len(dataframe) == 0) or (len(missing) > 0) or ('date' not in dataframe.columns):
+            if len(missing) > 0:
+                print(f"    LastCandleCache: missing columns {missing}. Using DataProvider for {pair}")
+            self.exit_candle_cache.pop(pair, None)
+            return
+
+        try:
+            values = dataframe[self.exit_candle_fields].to_numpy(dtype=float)
+        except (TypeError, ValueError) as e:
+            print(f"    LastCandleCache: non-numeric exit field ({e}). Using DataProvider for {pair}")
+            self.exit_candle_cache.pop(pair, None)
+            return
+
+        dates = dataframe['date'].values.astype('datetime64[ns]').astype('int64')
+
+        self.exit_candle_cache[pair] = (dates, values)
+
+    # get the row index of the last candle that is complete at current_time (-1 if there isn't one)
+    def get_exit_candle_index(self, dates, current_time) -> int:
+        tf_ns = timeframe_to_seconds(self.timeframe) * 1_000_000_000
+        cutoff = (int(current_time.timestamp()) * 1_000_000_000 // tf_ns) * tf_ns
+
+        # regular data, so the index can be calculated directly
+        row = int((cutoff - dates[0]) // tf_ns) - 1
+        if (0 <= row < len(dates)) and (dates[row] < cutoff) and \
+                ((row + 1 == len(dates)) or (dates[row + 1] >= cutoff)):
+            return row
+
+        # gaps in the data, so search
+        return int(np.searchsorted(dates, cutoff, side='left')) - 1
+
+    # get the last candle for a pair, as a dict of {field: value} (or a Series, if the DataProvider had to be used)
+    def get_last_candle(self, pair: str, current_time):
+
+        if (self.exit_candle_cache is not None) and (pair in self.exit_candle_cache):
+            dates, values = self.exit_candle_cache[pair]
+            if self.dp.runmode.value in ('backtest', 'hyperopt'):
+                row = self.get_exit_candle_index(dates, current_time)
+            else:
+                row = len(dates) - 1
+
+            if row >= 0:
+                return dict(zip(self.exit_candle_fields, values[row].tolist()))
+
+        dataframe, _ = self.dp.get_analyzed_dataframe(pair=pair, timeframe=self.timeframe)
+        return dataframe.iloc[-1].squeeze()
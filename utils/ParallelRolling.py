@@ -0,0 +1,122 @@
+# Utilities for running rolling (walk-forward) predictions in parallel
+#
+# The rolling approach retrains the forecaster on the previous train_len rows and then forecasts, for every row.
+# This is realistic but slow, and is inherently serial. To use multiple cores, the timeline is split into
+# independent chunks. Each chunk starts from a copy of the same (base) forecaster, which is warm-started by replaying
+# the training steps just before the first window of the chunk, and then rolls forward as normal.
+#
+# Chunk boundaries depend only on the data length and chunk size (not the number of workers), so the results are
+# reproducible for a given configuration.
+#
+# The worker function lives here (rather than in the strategy) so that it can be pickled by the process pool.
+
+import copy
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+# parameters needed by the worker (kept as a dict so that it's cheap to pickle)
+def make_params(win_size, lookahead, train_len, min_start, nrows, retrain, warmup):
+    return {
+        "win_size": win_size,
+        "lookahead": lookahead,
+        "train_len": train_len,
+        "min_start": min_start,  # no predictions until window start reaches this (need buffer for training)
+        "nrows": nrows,
+        "retrain": retrain,
+        "warmup": warmup,
+    }
+
+
+# get the training range for the window ending at 'end'
+def get_train_range(end, params):
+    train_end = min(end - params["lookahead"] - 1, params["nrows"] - params["lookahead"] - 2)
+    train_start = max(0, train_end - params["train_len"])
+    return train_start, train_end
+
+
+# split the window end positions into chunks. Returns a list of (first_end, last_end+1)
+def get_chunks(nrows, params, chunk_size):
+    first = params["win_size"]
+    last = nrows + 1
+    chunk_size = max(1, chunk_size)
+    return [(c, min(c + chunk_size, last)) for c in range(first, last, chunk_size)]
+
+
+# get the range of rows needed by a chunk (including warmup)
+def get_chunk_rows(chunk, params):
+    first_end, last_end = chunk
+    warm_end = max(params["win_size"], first_end - params["warmup"])
+    lo, _ = get_train_range(warm_end, params)
+    lo = max(0, min(lo, first_end - params["win_size"]))
+    return lo, last_end
+
+
+def train_forecaster(forecaster, data, labels):
+    x = np.nan_to_num(data)
+    y = np.nan_to_num(labels)
+    forecaster.train(x, y, incremental=True)
+
+
+# run the rolling predictions for a single chunk
+# data & labels are the rows [offset:...] of the full training data/labels
+# Returns the predictions for window ends [first_end, last_end) and the trained forecaster
+def rolling_forecast_chunk(forecaster, data, labels, offset, chunk, params, warm_start):
+    first_end, last_end = chunk
+    win_size = params["win_size"]
+    lookahead = params["lookahead"]
+    preds = np.zeros(last_end - first_end, dtype=float)
+
+    # warm start: replay the training steps before the first window of this chunk
+    if warm_start and params["retrain"]:
+        for end in range(max(win_size, first_end - params["warmup"]), first_end):
+            if (end - win_size) >= params["min_start"]:
+                train_start, train_end = get_train_range(end, params)
+                train_forecaster(forecaster, data[train_start - offset:train_end - offset],
+                                 labels[train_start - offset:train_end - offset])
+
+    for end in range(first_end, last_end):
+        start = end - win_size
+        if start < params["min_start"]:
+            preds[end - first_end] = 0.0
+            continue
+
+        # (re-)train the model on prior data and get predictions
+        if params["retrain"]:
+            train_start, train_end = get_train_range(end, params)
+            train_forecaster(forecaster, data[train_start - offset:train_end - offset],
+                             labels[train_start - offset:train_end - offset])
+
+        dslice = np.nan_to_num(data[start - offset:end - offset])
+        forecast = forecaster.forecast(dslice, lookahead)
+        forecast = np.clip(forecast, -3.0, 3.0)
+        preds[end - first_end] = np.ravel(forecast)[-1]
+
+    return preds, forecaster
+
+
+# run rolling predictions over the full data, in parallel chunks
+# Returns an array of predictions (indexed by row) and the forecaster from the last chunk
+def rolling_forecast(base_forecaster, data, labels, params, chunk_size=1024, num_workers=4):
+    nrows = np.shape(data)[0]
+    predictions = np.zeros(nrows, dtype=float)
+
+    chunks = get_chunks(nrows, params, chunk_size)
+    if len(chunks) == 0:
+        return predictions, base_forecaster
+
+    last_forecaster = base_forecaster
+    with ProcessPoolExecutor(max_workers=max(1, num_workers)) as executor:
+        futures = []
+        for i, chunk in enumerate(chunks):
+            lo, hi = get_chunk_rows(chunk, params)
+            futures.append(executor.submit(rolling_forecast_chunk, copy.deepcopy(base_forecaster),
+                                           data[lo:hi], labels[lo:hi], lo, chunk, params, i > 0))
+
+        # stitch the results back together, in order
+        for chunk, future in zip(chunks, futures):
+            preds, last_forecaster = future.result()
+            predictions[chunk[0] - 1:chunk[1] - 1] = preds
+
+    return predictions, last_forecaster
@@ -10,14 +10,217 @@ This class is factory for creating various kinds of Wavelet Transforms with a co
 
 from abc import ABC, abstractmethod
 from enum import Enum
+from functools import lru_cache
 
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 import pywt
 import scipy
 from scipy.fft import fft, hfft, ifft, ihfft, rfft, irfft, fftfreq
 from scipy.fft import fht, ifht
 from modwt import modwt, imodwt, modwtmra
 
+# -----------------------------------
+
+# Transform plans
+# A plan holds everything about a transform that only depends on (wavelet type, window length, level, mode): the
+# filters, the layout of the coefficients in the flattened (feature) array and the output lengths.
+# Plans are built once, shared (see make_plan()) and never modified afterwards, so unlike the wavelet classes below
+# they can be used from several threads at once. Results are written into arrays supplied by the caller.
+#
+# Usage:
+#   plan = wavelet.get_plan(window_length)
+#   out = np.empty((nrows, plan.out_len))
+#   plan.forward_batch_into(windows, out)
+#   plan.forward_into(window, out[0])
+#   series = plan.inverse_from(out[0])
+
+
+@lru_cache(maxsize=32)
+def get_pywt_wavelet(name):
+    return pywt.Wavelet(name)
+
+
+# get the (shared) plan. Plans are immutable, so the same object can be returned to every caller
+@lru_cache(maxsize=64)
+def make_plan(plan_type, wavelet_name: str, length: int, level: int, mode: str):
+    return plan_type(wavelet_name, length, level, mode)
+
+
+class transform_plan(ABC):
+
+    wavelet_name = ""
+    length = 0  # length of the input window
+    level = 0
+    mode = ""
+    out_len = 0  # number of features produced for each window
+    values_len = 0  # length of the series produced by inverse_from()
+
+    def __init__(self, wavelet_name: str, length: int, level: int, mode: str):
+        super().__init__()
+        self.wavelet_name = wavelet_name
+        self.length = length
+        self.level = level
+        self.mode = mode
+
+    # transform each row of windows, writing the features into out (nrows, out_len)
+    @abstractmethod
+    def forward_batch_into(self, windows: np.array, out: np.array):
+        return out
+
+    # transform a single window, writing the features into out_row (out_len)
+    def forward_into(self, data: np.array, out_row: np.array):
+        self.forward_batch_into(np.reshape(data, (1, -1)), np.reshape(out_row, (1, -1)))
+        return out_row
+
+    # convert features back into a series. Written into out (values_len), if supplied
+    @abstractmethod
+    def inverse_from(self, row: np.array, out: np.array = None) -> np.array:
+        return out
+
+    # copy the result of an inverse transform into out (if supplied)
+    def copy_values(self, series: np.array, out: np.array) -> np.array:
+        if out is None:
+            return series
+        out[:] = series[:len(out)]
+        return out
+
+
+# DWT plan (pywt.wavedec/waverec). Features are [cA_n, cD_n, ..., cD_1], i.e. the same layout as pywt.coeffs_to_array
+class dwt_plan(transform_plan):
+
+    wavelet = None
+    coeff_lens = ()
+    offsets = ()
+    coeff_slices = None
+
+    def __init__(self, wavelet_name: str, length: int, level: int, mode: str):
+        super().__init__(wavelet_name, length, level, mode)
+        self.wavelet = get_pywt_wavelet(wavelet_name)
+
+        coeffs = pywt.wavedec(np.zeros(length), self.wavelet, mode=mode, level=level)
+        self.coeff_lens = tuple(len(c) for c in coeffs)
+        self.offsets = tuple(int(o) for o in np.cumsum((0,) + self.coeff_lens))
+        _, self.coeff_slices = pywt.coeffs_to_array(coeffs)
+        self.out_len = self.offsets[-1]
+        self.values_len = len(pywt.waverec(coeffs, self.wavelet, mode=mode))
+
+    # get the coefficients as a list of arrays (along the last axis)
+    def transform(self, data: np.array):
+        return pywt.wavedec(data, self.wavelet, mode=self.mode, level=self.level, axis=-1)
+
+    # split a feature row into the coefficient arrays (views, no copy)
+    def split(self, row: np.array):
+        return [row[self.offsets[i]:self.offsets[i+1]] for i in range(len(self.coeff_lens))]
+
+    def forward_batch_into(self, windows: np.array, out: np.array):
+        coeffs = self.transform(windows)
+        for i, c in enumerate(coeffs):
+            out[:, self.offsets[i]:self.offsets[i+1]] = c
+        return out
+
+    def inverse_from(self, row: np.array, out: np.array = None) -> np.array:
+        series = pywt.waverec(self.split(row), self.wavelet, mode=self.mode)
+        return self.copy_values(series, out)
+
+
+# DWTA plan. Features are just the approximation coefficients, the (thresholded) details are needed for the inverse
+class dwta_plan(dwt_plan):
+
+    threshold = 0.001
+
+    def __init__(self, wavelet_name: str, length: int, level: int, mode: str):
+        super().__init__(wavelet_name, length, level, mode)
+        self.out_len = self.coeff_lens[0]
+
+    def transform(self, data: np.array):
+        coeffs = super().transform(data)
+        coeffs[1:] = [pywt.threshold(c, value=self.threshold, mode='garotte') for c in coeffs[1:]]
+        return coeffs
+
+    def forward_batch_into(self, windows: np.array, out: np.array):
+        out[:] = self.transform(windows)[0]
+        return out
+
+    # details: detail coefficients [cD_n, ..., cD_1] to use (e.g. from self.transform() of a reference window).
+    # If not supplied, they are set to zero
+    def inverse_from(self, row: np.array, out: np.array = None, details=None) -> np.array:
+        if details is None:
+            details = [np.zeros(n) for n in self.coeff_lens[1:]]
+        series = pywt.waverec([row] + list(details), self.wavelet, mode=self.mode)
+        return self.copy_values(series, out)
+
+
+# SWT plan. Odd-length windows are trimmed (first sample dropped). level is the maximum level
+class swt_plan(dwt_plan):
+
+    def __init__(self, wavelet_name: str, length: int, level: int, mode: str):
+        transform_plan.__init__(self, wavelet_name, length, level, mode)
+        self.wavelet = get_pywt_wavelet(wavelet_name)
+
+        self.trim = length % 2
+        self.values_len = length - self.trim
+        self.level = min(level, pywt.swt_max_level(self.values_len))
+        self.coeff_lens = (self.values_len,) * (self.level + 1)
+        self.offsets = tuple(self.values_len * i for i in range(self.level + 2))
+        _, self.coeff_slices = pywt.coeffs_to_array([np.zeros(n) for n in self.coeff_lens])
+        self.out_len = self.offsets[-1]
+
+    def transform(self, data: np.array):
+        return pywt.swt(data[..., self.trim:], self.wavelet, level=self.level, trim_approx=True, axis=-1)
+
+    def inverse_from(self, row: np.array, out: np.array = None) -> np.array:
+        series = pywt.iswt(self.split(row), wavelet=self.wavelet)
+        return self.copy_values(series, out)
+
+
+# MODWT plan. Features are the flattened (level+1, length) coefficient array
+class modwt_plan(transform_plan):
+
+    def __init__(self, wavelet_name: str, length: int, level: int, mode: str):
+        super().__init__(wavelet_name, length, level, mode)
+        self.out_len = (level + 1) * length
+        self.values_len = length
+
+    def forward_batch_into(self, windows: np.array, out: np.array):
+        coeffs = modwt(windows, self.wavelet_name, self.level)
+        out[:] = coeffs.reshape(np.shape(coeffs)[0], -1)
+        return out
+
+    def inverse_from(self, row: np.array, out: np.array = None) -> np.array:
+        series = imodwt(np.reshape(row, (self.level + 1, self.length)), self.wavelet_name)
+        return self.copy_values(series, out)
+
+
+# FFT plan. Features are [real, imag] of the first 'level' frequencies (all frequencies if level is 0)
+class fft_plan(transform_plan):
+
+    nfreqs = 0  # number of frequencies produced by rfft()
+    ncoeffs = 0  # number of frequencies kept
+
+    def __init__(self, wavelet_name: str, length: int, level: int, mode: str):
+        super().__init__(wavelet_name, length, level, mode)
+        self.nfreqs = length // 2 + 1
+        self.ncoeffs = self.nfreqs if level <= 0 else min(level, self.nfreqs)
+        self.out_len = 2 * self.ncoeffs
+        self.values_len = length
+
+    def forward_batch_into(self, windows: np.array, out: np.array):
+        freqs = rfft(windows, axis=-1)[:, :self.ncoeffs]
+        out[:, :self.ncoeffs] = np.real(freqs)
+        out[:, self.ncoeffs:] = np.imag(freqs)
+        return out
+
+    def inverse_from(self, row: np.array, out: np.array = None) -> np.array:
+        freqs = np.zeros(self.nfreqs, dtype=complex)
+        freqs.real[:self.ncoeffs] = row[:self.ncoeffs]
+        freqs.imag[:self.ncoeffs] = row[self.ncoeffs:]
+        series = irfft(freqs, n=self.length)
+        return self.copy_values(series, out)
+
+
+# -----------------------------------
+
 # all actual instantiations follow this base class
 
 class base_wavelet(ABC):
@@ -32,9 +235,21 @@ class base_wavelet(ABC):
     data_shape = None
     lookahead = 0
 
+    # transform plan parameters (see transform_plan). No plan_type means that plans are not supported
+    plan_type = None
+    plan_wavelet = ""
+    plan_level = 0
+    plan_mode = ""
+
     def __init__(self):
         super().__init__()
 
+    # get the (shared) transform plan for windows of the given length, or None if not supported
+    def get_plan(self, length: int):
+        if self.plan_type is None:
+            return None
+        return make_plan(self.plan_type, self.plan_wavelet, length, self.plan_level, self.plan_mode)
+
     # function to get transform coefficients  (different for each wavelet type)
     @abstractmethod
     def get_coeffs(self, data: np.array) -> np.array:
@@ -73,6 +288,26 @@ class base_wavelet(ABC):
         return coeffs
 
 
+    # get the (flattened) coefficients for every sliding window of length 'window' in data.
+    # Row i of the result is coeff_to_array(get_coeffs(data[i:i+window])), and the saved state (slices etc.)
+    # is the same as if the last window had been processed on its own
+    def get_coeffs_windows(self, data: np.array, window: int) -> np.array:
+        data = np.asarray(data, dtype=float)
+        if len(data) < window:
+            return np.zeros((0, 0), dtype=float)
+        windows = sliding_window_view(data, window)
+        return self.get_coeffs_batch(windows)
+
+    # batch version of get_coeffs() + coeff_to_array(). Each row of windows is transformed separately.
+    # This generic version just loops through the rows, subclasses override it with a vectorised version
+    def get_coeffs_batch(self, windows: np.array) -> np.array:
+        nrows = np.shape(windows)[0]
+        if nrows == 0:
+            return np.zeros((0, 0), dtype=float)
+
+        features = [np.array(self.coeff_to_array(self.get_coeffs(np.array(windows[i])))) for i in range(nrows)]
+        return np.array(features)
+
     # set lookahead value (for detrending). Only need to do this if you are projecting ahead
     def set_lookahead(self, lookahead):
         self.lookahead = lookahead
@@ -131,13 +366,18 @@ class cwt_wavelet(base_wavelet):
 
 class dwt_wavelet(base_wavelet):
 
+    plan_type = dwt_plan
+    plan_wavelet = 'bior3.9'
+    plan_level = 2
+    plan_mode = 'symmetric'
+
     def get_coeffs(self, data: np.array) -> np.array:
 
         x = data
 
         # get the DWT coefficients
         self.wavelet_type = 'bior3.9'
-        self.wavelet = pywt.Wavelet(self.wavelet_type)
+        self.wavelet = get_pywt_wavelet(self.wavelet_type)
         self.mode = 'symmetric'
         self.coeff_format = "wavedec"
         level = 2
@@ -162,6 +402,21 @@ class dwt_wavelet(base_wavelet):
 
         return coeffs
 
+    def get_coeffs_batch(self, windows: np.array) -> np.array:
+
+        plan = self.get_plan(np.shape(windows)[-1])
+        features = np.empty((np.shape(windows)[0], plan.out_len), dtype=float)
+        plan.forward_batch_into(windows, features)
+
+        # state needed by array_to_coeff() and get_values()
+        self.wavelet_type = plan.wavelet_name
+        self.wavelet = plan.wavelet
+        self.mode = plan.mode
+        self.coeff_format = "wavedec"
+        self.coeff_slices = plan.coeff_slices
+
+        return features
+
     def get_values(self, coeffs):
 
         series = pywt.waverec(coeffs, wavelet=self.wavelet, mode=self.mode)
@@ -188,13 +443,18 @@ class dwt_wavelet(base_wavelet):
 
 class dwta_wavelet(base_wavelet):
 
+    plan_type = dwta_plan
+    plan_wavelet = 'bior3.9'
+    plan_level = 2
+    plan_mode = 'per'
+
     def get_coeffs(self, data: np.array) -> np.array:
 
         x = data
 
         # get the DWT coefficients
         self.wavelet_type = 'bior3.9'
-        self.wavelet = pywt.Wavelet(self.wavelet_type)
+        self.wavelet = get_pywt_wavelet(self.wavelet_type)
         # self.mode = 'symmetric'
         self.mode = 'per'
         self.coeff_format = "wavedec"
@@ -212,6 +472,22 @@ class dwta_wavelet(base_wavelet):
 
         return coeffs
 
+    def get_coeffs_batch(self, windows: np.array) -> np.array:
+
+        plan = self.get_plan(np.shape(windows)[-1])
+        features = np.empty((np.shape(windows)[0], plan.out_len), dtype=float)
+        plan.forward_batch_into(windows, features)
+
+        self.wavelet_type = plan.wavelet_name
+        self.wavelet = plan.wavelet
+        self.mode = plan.mode
+        self.coeff_format = "wavedec"
+
+        # detail coeffs from the last row are needed for reconstruction
+        self.save_coeffs = plan.transform(np.array(windows[-1]))
+
+        return features
+
     def get_values(self, coeffs):
         # series = pywt.waverec(coeffs, self.wavelet)
 
@@ -240,6 +516,9 @@ class dwta_wavelet(base_wavelet):
 # FFT - Fast Fourier Transform
 
 class fft_wavelet(base_wavelet):
+
+    plan_type = fft_plan
+
     def get_coeffs(self, data: np.array) -> np.array:
 
         x = data
@@ -262,6 +541,16 @@ class fft_wavelet(base_wavelet):
 
         return coeffs
 
+    def get_coeffs_batch(self, windows: np.array) -> np.array:
+
+        plan = self.get_plan(np.shape(windows)[-1])
+        coeffs = np.empty((np.shape(windows)[0], plan.out_len), dtype=float)
+        plan.forward_batch_into(windows, coeffs)
+
+        self.data_shape = (plan.out_len,)
+
+        return coeffs
+
     def get_values(self, coeffs):
         # reconstruct the data
         series = irfft(coeffs)
@@ -295,6 +584,9 @@ class ffta_wavelet(base_wavelet):
 
     orig_len = 0
 
+    plan_type = fft_plan
+    plan_level = 8  # number of harmonics kept
+
     def get_coeffs(self, data: np.array) -> np.array:
 
         x = data
@@ -320,6 +612,18 @@ class ffta_wavelet(base_wavelet):
 
         return coeffs
 
+    def get_coeffs_batch(self, windows: np.array) -> np.array:
+
+        # plan truncates the higher harmonics
+        plan = self.get_plan(np.shape(windows)[-1])
+        coeffs = np.empty((np.shape(windows)[0], plan.out_len), dtype=float)
+        plan.forward_batch_into(windows, coeffs)
+
+        self.orig_len = plan.nfreqs
+        self.data_shape = (plan.out_len,)
+
+        return coeffs
+
     def get_values(self, coeffs):
         # reconstruct the data
         series = irfft(coeffs)
@@ -417,6 +721,11 @@ class fht_wavelet(base_wavelet):
 # MODWT - Maximal Overlap Discrete Wavelet Transform
 
 class modwt_wavelet(base_wavelet):
+
+    plan_type = modwt_plan
+    plan_wavelet = 'haar'
+    plan_level = 5
+
     def get_coeffs(self, data: np.array) -> np.array:
 
         x = data
@@ -433,6 +742,17 @@ class modwt_wavelet(base_wavelet):
         coeffs = modwt(x, self.wavelet, level)
         return coeffs
 
+    def get_coeffs_batch(self, windows: np.array) -> np.array:
+
+        plan = self.get_plan(np.shape(windows)[-1])
+        coeffs = np.empty((np.shape(windows)[0], plan.out_len), dtype=float)
+        plan.forward_batch_into(windows, coeffs)
+
+        self.wavelet = plan.wavelet_name
+        self.data_shape = (plan.level + 1, plan.length)
+
+        return coeffs
+
     def get_values(self, coeffs):
         series = imodwt(coeffs, self.wavelet)
 
@@ -453,6 +773,11 @@ class modwt_wavelet(base_wavelet):
 # SWT - Standing Wave Transform
 
 class swt_wavelet(base_wavelet):
+
+    plan_type = swt_plan
+    plan_wavelet = 'bior3.9'
+    plan_level = 2
+
     def get_coeffs(self, data: np.array) -> np.array:
 
         x = data
@@ -470,6 +795,19 @@ class swt_wavelet(base_wavelet):
         coeffs = pywt.swt(x, self.wavelet, level=levels, trim_approx=True)
         return coeffs
 
+    def get_coeffs_batch(self, windows: np.array) -> np.array:
+
+        # plan trims odd-length windows
+        plan = self.get_plan(np.shape(windows)[-1])
+        coeffs = np.empty((np.shape(windows)[0], plan.out_len), dtype=float)
+        plan.forward_batch_into(windows, coeffs)
+
+        self.wavelet = plan.wavelet_name
+        self.coeff_format = "wavedec"
+        self.coeff_slices = plan.coeff_slices
+
+        return coeffs
+
     def get_values(self, coeffs):
         series = pywt.iswt(coeffs, wavelet=self.wavelet)
 
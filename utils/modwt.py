@@ -3,6 +3,8 @@ modwt.py - Python implementation of matlab modwt
             based on https://github.com/pistonly/modwtpy
 '''
 
+from functools import lru_cache
+
 import numpy as np
 import pdb
 import pywt
@@ -88,53 +90,74 @@ def circular_convolve_s(h_t, g_t, w_j, v_j, j):
     return v_j_1
 
 
-def modwt(x, filters, level):
-    '''
-    filters: 'db1', 'db2', 'haar', ...
-    return: see matlab
-    '''
-    # filter
-    wavelet = pywt.Wavelet(filters)
-    h = wavelet.dec_hi
-    g = wavelet.dec_lo
-    h_t = np.array(h) / np.sqrt(2)
-    g_t = np.array(g) / np.sqrt(2)
-    wavecoeff = []
-    v_j_1 = x
-    for j in range(level):
-        w = circular_convolve_d(h_t, v_j_1, j + 1)
-        v_j_1 = circular_convolve_d(g_t, v_j_1, j + 1)
-        wavecoeff.append(w)
-    wavecoeff.append(v_j_1)
-    return np.vstack(wavecoeff)
+# -----------------------------------
+# FFT implementation
+# All of the MODWT operations are circular convolutions, so each level can be applied as a multiplication in the
+# frequency domain. The (cumulative) filter spectra only depend on (filters, level, N), so they are calculated once
+# (from the impulse responses of the convolution functions above, so the alignment is identical) and cached.
+# The transforms then work on a batch of signals (rows) at once.
 
 
-def imodwt(w, filters):
-    ''' inverse modwt '''
-    # filter
+# normalised decomposition filters (h_t, g_t)
+@lru_cache(maxsize=32)
+def get_filters(filters):
     wavelet = pywt.Wavelet(filters)
-    h = wavelet.dec_hi
-    g = wavelet.dec_lo
-    h_t = np.array(h) / np.sqrt(2)
-    g_t = np.array(g) / np.sqrt(2)
-    level = len(w) - 1
-    v_j = w[-1]
-    for jp in range(level):
-        j = level - jp - 1
-        v_j = circular_convolve_s(h_t, g_t, w[j], v_j, j + 1)
-    return v_j
+    h_t = np.array(wavelet.dec_hi) / np.sqrt(2)
+    g_t = np.array(wavelet.dec_lo) / np.sqrt(2)
+    return h_t, g_t
 
 
-def modwtmra(w, filters):
-    ''' Multiresolution analysis based on MODWT'''
-    # filter
+def impulse(N):
+    x = np.zeros(N)
+    x[0] = 1.0
+    return x
+
+
+# spectra of the forward transform, shape (level+1, N//2+1): W_1..W_level, V_level
+@lru_cache(maxsize=64)
+def modwt_spectra(filters, level, N):
+    h_t, g_t = get_filters(filters)
+    delta = impulse(N)
+    spectra = []
+    v_spec = np.ones(N // 2 + 1, dtype=complex)
+    for j in range(level):
+        h_spec = np.fft.rfft(circular_convolve_d(h_t, delta, j + 1))
+        g_spec = np.fft.rfft(circular_convolve_d(g_t, delta, j + 1))
+        spectra.append(v_spec * h_spec)
+        v_spec = v_spec * g_spec
+    spectra.append(v_spec)
+    spectra = np.array(spectra)
+    spectra.flags.writeable = False
+    return spectra
+
+
+# spectra of the inverse transform, shape (level+1, N//2+1). The signal is the sum of the filtered coefficients
+@lru_cache(maxsize=64)
+def imodwt_spectra(filters, level, N):
+    h_t, g_t = get_filters(filters)
+    delta = impulse(N)
+    zero = np.zeros(N)
+    spectra = []
+    v_spec = np.ones(N // 2 + 1, dtype=complex)
+    for j in range(level):
+        h_spec = np.fft.rfft(circular_convolve_s(h_t, g_t, delta, zero, j + 1))
+        g_spec = np.fft.rfft(circular_convolve_s(h_t, g_t, zero, delta, j + 1))
+        spectra.append(v_spec * h_spec)
+        v_spec = v_spec * g_spec
+    spectra.append(v_spec)
+    spectra = np.array(spectra)
+    spectra.flags.writeable = False
+    return spectra
+
+
+# spectra of the MRA filters, shape (level+1, N//2+1): D_1..D_level, S_level
+@lru_cache(maxsize=64)
+def modwtmra_spectra(filters, level, N):
     wavelet = pywt.Wavelet(filters)
     h = wavelet.dec_hi
     g = wavelet.dec_lo
-    # D
-    level, N = w.shape
-    level = level - 1
-    D = []
+    delta = impulse(N)
+    spectra = []
     g_j_part = [1]
     for j in range(level):
         # g_j_part
@@ -146,16 +169,50 @@ def modwtmra(w, filters):
         h_j_t = h_j / (2**((j + 1) / 2.))
         if j == 0: h_j_t = h / np.sqrt(2)
         h_j_t_o = period_list(h_j_t, N)
-        D.append(circular_convolve_mra(h_j_t_o, w[j]))
+        spectra.append(np.fft.rfft(circular_convolve_mra(h_j_t_o, delta)))
     # S
     j = level - 1
     g_j_up = upArrow_op(g, j + 1)
     g_j = np.convolve(g_j_part, g_j_up)
     g_j_t = g_j / (2**((j + 1) / 2.))
     g_j_t_o = period_list(g_j_t, N)
-    S = circular_convolve_mra(g_j_t_o, w[-1])
-    D.append(S)
-    return np.vstack(D)
+    spectra.append(np.fft.rfft(circular_convolve_mra(g_j_t_o, delta)))
+    spectra = np.array(spectra)
+    spectra.flags.writeable = False
+    return spectra
+
+
+def modwt(x, filters, level):
+    '''
+    filters: 'db1', 'db2', 'haar', ...
+    x: 1d array, or 2d array of rows (transformed along the last axis)
+    return: see matlab. Shape is (level+1, N), or (nrows, level+1, N) for 2d input
+    '''
+    x = np.asarray(x, dtype=float)
+    N = np.shape(x)[-1]
+    spectra = modwt_spectra(filters, level, N)
+    x_spec = np.fft.rfft(x, axis=-1)
+    return np.fft.irfft(x_spec[..., np.newaxis, :] * spectra, n=N, axis=-1)
+
+
+def imodwt(w, filters):
+    ''' inverse modwt. w: (level+1, N), or (nrows, level+1, N) '''
+    w = np.asarray(w, dtype=float)
+    level = np.shape(w)[-2] - 1
+    N = np.shape(w)[-1]
+    spectra = imodwt_spectra(filters, level, N)
+    w_spec = np.fft.rfft(w, axis=-1)
+    return np.fft.irfft(np.sum(w_spec * spectra, axis=-2), n=N, axis=-1)
+
+
+def modwtmra(w, filters):
+    ''' Multiresolution analysis based on MODWT. w: (level+1, N), or (nrows, level+1, N) '''
+    w = np.asarray(w, dtype=float)
+    level = np.shape(w)[-2] - 1
+    N = np.shape(w)[-1]
+    spectra = modwtmra_spectra(filters, level, N)
+    w_spec = np.fft.rfft(w, axis=-1)
+    return np.fft.irfft(w_spec * spectra, n=N, axis=-1)
 
 
 if __name__ == '__main__':